@@ -0,0 +1,198 @@
+"""Extraction of zip, tar (plain, gz, bz2, xz) and single gz/bz2/xz files for sort.py
+
+Members are streamed to disk in CHUNK_SIZE pieces, so memory use does not
+depend on the size of a member. Tar archives are read in stream mode, without
+collecting the member list first. Zip members of at least PARALLEL_SIZE bytes
+are decompressed on a thread pool, each thread with its own handle to the
+archive; zlib, bz2 and lzma release the GIL while they work.
+
+Every archive is checked against Limits while it is extracted: the number of
+entries, the total size written and the ratio of that size to the size of the
+archive, to stop zip bombs before they fill the disk. Members with absolute
+paths or '..' in them, links and special files are not extracted. When any
+check fails everything written so far is removed and ArchiveError is raised.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+PARALLEL_SIZE = 16 * 1024 * 1024
+PARALLEL_WORKERS = 4
+
+MAX_ENTRIES = 100_000
+MAX_SIZE = 4 * 1024 ** 3
+MAX_RATIO = 200
+# small archives may always unpack to this much, whatever their ratio
+MIN_LIMIT = 64 * 1024 * 1024
+
+SINGLE_FILE_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+SINGLE_FILE_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def archive_format(path):
+    """'zip', 'tar', 'gzip', 'bz2' or 'xz' judging by the content of path, None for anything else"""
+    if zipfile.is_zipfile(path):
+        return 'zip'
+    try:
+        if tarfile.is_tarfile(path):
+            return 'tar'
+    except (OSError, EOFError, tarfile.TarError, lzma.LZMAError):
+        # a compressed file that does not hold a tar archive
+        pass
+    with open(path, 'rb') as file:
+        start = file.read(6)
+    for magic, name in SINGLE_FILE_MAGIC:
+        if start.startswith(magic):
+            return name
+    return None
+
+
+def member_path(name):
+    """relative path of an archive member, ArchiveError when it would end up outside the folder"""
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or name.startswith(('/', '\\')) or '..' in parts or ':' in parts[0]:
+        raise ArchiveError(f'Unsafe member path: {name}')
+    return os.path.join(*parts)
+
+
+class Limits:
+    """entries and bytes written for one archive, shared by the threads extracting it"""
+
+    def __init__(self, archive_size, max_entries=MAX_ENTRIES, max_size=MAX_SIZE, max_ratio=MAX_RATIO):
+        self.max_entries = max_entries
+        self.max_size = min(max_size, max(archive_size * max_ratio, MIN_LIMIT))
+        self.entries = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add_entry(self):
+        self.entries += 1
+        if self.entries > self.max_entries:
+            raise ArchiveError(f'More than {self.max_entries} entries')
+
+    def reserve(self, size):
+        with self.lock:
+            self.size += size
+            if self.size > self.max_size:
+                raise ArchiveError(f'Unpacks to more than {self.max_size} bytes')
+
+
+class Extraction:
+    """one archive being extracted into folder"""
+
+    def __init__(self, path, folder, limits=None):
+        self.path = path
+        self.folder = folder
+        self.limits = limits or Limits(os.path.getsize(path))
+        self.folder_existed = os.path.isdir(folder)
+        self.written = []
+        self.created = set()
+
+    def destination(self, name):
+        return os.path.join(self.folder, member_path(name))
+
+    def make_directory(self, name):
+        os.makedirs(self.destination(name), exist_ok=True)
+
+    def copy(self, source, destination, size=None):
+        """stream source into destination, size is the declared size when it is known up front"""
+        directory = os.path.dirname(destination)
+        if directory not in self.created:
+            os.makedirs(directory, exist_ok=True)
+            self.created.add(directory)
+        self.written.append(destination)
+        with open(destination, 'wb') as file:
+            if size is not None:
+                self.limits.reserve(size)
+            while chunk := source.read(CHUNK_SIZE):
+                if size is None:
+                    self.limits.reserve(len(chunk))
+                file.write(chunk)
+
+    def extract_zip(self):
+        with zipfile.ZipFile(self.path) as archive:
+            members = archive.infolist()
+            large = []
+            for info in members:
+                self.limits.add_entry()
+                if info.is_dir():
+                    self.make_directory(info.filename)
+                    continue
+                if info.file_size >= PARALLEL_SIZE:
+                    large.append(info)
+                    continue
+                # a zip member never yields more than its declared size
+                with archive.open(info) as source:
+                    self.copy(source, self.destination(info.filename), info.file_size)
+        if large:
+            with ThreadPoolExecutor(max_workers=PARALLEL_WORKERS) as pool:
+                for future in [pool.submit(self.extract_zip_member, info) for info in large]:
+                    future.result()
+
+    def extract_zip_member(self, info):
+        with zipfile.ZipFile(self.path) as archive, archive.open(info) as source:
+            self.copy(source, self.destination(info.filename), info.file_size)
+
+    def extract_tar(self):
+        with tarfile.open(self.path, 'r|*') as archive:
+            for member in archive:
+                self.limits.add_entry()
+                if member.isfile():
+                    self.copy(archive.extractfile(member), self.destination(member.name), member.size)
+                elif member.isdir():
+                    self.make_directory(member.name)
+                else:
+                    print(f"Skipping {member.name} in {os.path.basename(self.path)}: not a regular file")
+
+    def extract_single(self, opener):
+        self.limits.add_entry()
+        name = os.path.basename(self.path).rsplit('.', 1)[0]
+        with opener(self.path, 'rb') as source:
+            self.copy(source, self.destination(name))
+
+    def run(self, kind):
+        try:
+            if kind == 'zip':
+                self.extract_zip()
+            elif kind == 'tar':
+                self.extract_tar()
+            else:
+                self.extract_single(SINGLE_FILE_OPENERS[kind])
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError) as e:
+            self.remove_written()
+            raise ArchiveError(f'Cannot extract: {e}') from None
+        except ArchiveError:
+            self.remove_written()
+            raise
+        return self.written
+
+    def remove_written(self):
+        if not self.folder_existed:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            return
+        for path in self.written:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def extract(path, folder, limits=None):
+    """extract the archive at path into folder, return the paths of the files written
+
+    raises ArchiveError for files that are not archives, broken archives and archives over the limits"""
+    kind = archive_format(path)
+    if kind is None:
+        raise ArchiveError('Not a zip, tar, gz, bz2 or xz archive')
+    return Extraction(path, folder, limits).run(kind)
@@ -0,0 +1,36 @@
+"""Writing a file so that a crash leaves either the old or the new one
+
+Used by the address book's snapshots and journals as well as by sort.py's
+manifest, so it depends on neither.
+"""
+import os
+
+
+def save_atomically(filename, write):
+    """call write(file) on a temporary file and move it over filename once it is on disk,
+    so a crash leaves either the old or the new file but never a truncated one"""
+    temporary = f'{filename}.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            result = write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        # a failed or interrupted write leaves filename as it was and no temporary file
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+    try:
+        folder = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    except OSError:
+        return result
+    try:
+        os.fsync(folder)
+    except OSError:
+        pass
+    finally:
+        os.close(folder)
+    return result
@@ -0,0 +1,6 @@
+"""Benchmarks of the address book and sort.py
+
+Run from Code/: python -m benchmarks for the suite (see suite.py), and
+python -m benchmarks micro [name ...] for the micro-benchmarks in micro.py and
+python -m benchmarks load for a load test of main.py --serve (see load.py).
+"""
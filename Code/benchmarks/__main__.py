@@ -0,0 +1,11 @@
+import sys
+
+if len(sys.argv) > 1 and sys.argv[1] == 'micro':
+    from benchmarks import micro
+    micro.main(sys.argv[2:])
+elif len(sys.argv) > 1 and sys.argv[1] == 'load':
+    from benchmarks import load
+    load.main(sys.argv[2:])
+else:
+    from benchmarks import suite
+    sys.exit(suite.main())
@@ -0,0 +1,128 @@
+"""Seeded generators of address books, file names, command scripts and file trees
+
+The same arguments give the same data on every run and machine, so timings of
+two runs, or of two commits, are taken on identical input.
+"""
+import os
+import random
+import zipfile
+
+from classes import AddressBook, Record
+
+FIRST_NAMES = ('Olena', 'Taras', 'Bohdan', 'Oksana', 'Iryna', 'Andrii', 'Maria', 'John',
+               'Олена', 'Тарас', 'Богдан', 'Оксана', 'Назар', 'Дмитро', 'Ярослава', 'Марта')
+LAST_NAMES = ('Kovalenko', 'Shevchenko', 'Bondar', 'Tkachenko', 'Smith',
+              'Коваленко', 'Шевченко', 'Бондар', 'Ткаченко', 'Мельник')
+TREE_EXTENSIONS = ('jpg', 'png', 'txt', 'pdf', 'mp3', 'mp4', 'zip', 'docx', 'xyz', '')
+RANDOM_EXTENSIONS = tuple(extension for extension in TREE_EXTENSIONS if extension != 'zip')
+
+
+def make_book(size, seed=0):
+    """size contacts named Contact0, Contact1, ... with one phone each"""
+    rnd = random.Random(seed)
+    book = AddressBook()
+    for i in range(size):
+        record = Record(f"Contact{i}")
+        record.add_phone(f"{rnd.randrange(10 ** 10):010d}")
+        book[str(record.name)] = record
+    return book
+
+
+def iter_contacts(size, seed=0):
+    """(name, phones, birthday) of size contacts with Latin and Cyrillic names, all valid and
+    distinct; one in three has no birthday, some have up to three phones"""
+    rnd = random.Random(seed)
+    for i in range(size):
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {i}"
+        phones = [f"{rnd.randrange(10 ** 10):010d}" for _ in range(rnd.choice((1, 1, 1, 2, 3)))]
+        birthday = None
+        if rnd.randrange(3):
+            birthday = f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(1940, 2015)}"
+        yield name, phones, birthday
+
+
+def misspell(name, rnd, typos=2):
+    """name with up to typos letters replaced or swapped with the next one"""
+    letters = list(name)
+    for _ in range(rnd.randint(1, typos)):
+        i = rnd.randrange(len(letters) - 1)
+        if rnd.random() < 0.5:
+            letters[i] = rnd.choice('aeiouyаеиоу')
+        else:
+            letters[i], letters[i + 1] = letters[i + 1], letters[i]
+    return ''.join(letters)
+
+
+def make_names(count, distinct, seed=0):
+    """count (file name, extension) drawn from distinct ones, Cyrillic and Latin, some with
+    several dots or none"""
+    rnd = random.Random(seed)
+    words = ['звіт', 'фото', 'Відпустка', 'report', 'IMG', 'scan copy', 'договір (1)', 'final-v2']
+    extensions = ['jpg', 'txt', 'pdf', 'tar.gz', 'mp3', 'docx', '']
+    pool = []
+    for i in range(distinct):
+        extension = rnd.choice(extensions)
+        stem = f"{rnd.choice(words)} {i}"
+        if rnd.random() < 0.2:
+            stem += f".{rnd.choice(words)}"
+        pool.append((f"{stem}.{extension}" if extension else stem, extension))
+    return [rnd.choice(pool) for _ in range(count)]
+
+
+def make_script(lines, seed=0):
+    """lines of main.py commands on contacts named contact0 ... contact9999"""
+    rnd = random.Random(seed)
+    templates = ["add contact{0} {1:010d} 01.02.1990", "finde contact{0}", "change phone contact{0} {1:010d} {1:010d}",
+                 "birthday contact{0} 03.04.1985", "when contact{0}", "upcoming 7", "remove contact{0} {1:010d}",
+                 "delete contact{0}", "show all", "search contact{0}", "good bye", "unknown{0}"]
+    return [rnd.choice(templates).format(rnd.randrange(10_000), rnd.randrange(10 ** 10)) for _ in range(lines)]
+
+
+def make_zip(path, rnd, members=3):
+    """a zip archive of members random files in a folder of their own"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for i in range(members):
+            extension = rnd.choice(RANDOM_EXTENSIONS[:-1])
+            archive.writestr(f"inner/member{i}.{extension}", os.urandom(rnd.randrange(64, 4096)))
+
+
+def make_tree(root, files, per_folder=1000, fanout=10, depth=2, seed=None, archives=0.0):
+    """a tree of files with mixed extensions, per_folder files in each leaf folder, leaf folders
+    depth levels below root with fanout folders per level
+
+    Without a seed the files are empty and their extensions cycle; with one the extensions and
+    sizes are random, some names are Cyrillic, and the given fraction of the files are real zip
+    archives."""
+    rnd = random.Random(seed)
+    for index in range(0, files, per_folder):
+        leaf = index // per_folder
+        parts = []
+        for _ in range(depth - 1):
+            leaf, digit = divmod(leaf, fanout)
+            parts.append(f"d{digit}")
+        # the top level takes whatever is left, so no two leaves share a folder
+        folder = os.path.join(root, f"d{leaf}", *reversed(parts))
+        os.makedirs(folder, exist_ok=True)
+        for i in range(index, min(index + per_folder, files)):
+            if seed is None:
+                extension = TREE_EXTENSIONS[i % len(TREE_EXTENSIONS)]
+                open(os.path.join(folder, f"file{i}.{extension}" if extension else f"file{i}"), 'w').close()
+                continue
+            stem = f"{rnd.choice(FIRST_NAMES)} {i}"
+            if rnd.random() < archives:
+                make_zip(os.path.join(folder, f"{stem}.zip"), rnd)
+                continue
+            # zip files are all real archives, the rest are random bytes
+            extension = rnd.choice(RANDOM_EXTENSIONS)
+            with open(os.path.join(folder, f"{stem}.{extension}" if extension else stem), 'wb') as file:
+                file.write(os.urandom(rnd.randrange(0, 2048)))
+
+
+def make_empty_folders(root, fanout=10, depth=4):
+    """fanout ** depth nested empty folders below root, and the folders above them"""
+    if depth == 0:
+        return
+    for i in range(fanout):
+        folder = os.path.join(root, f"e{i}")
+        os.makedirs(folder, exist_ok=True)
+        make_empty_folders(folder, fanout, depth - 1)
@@ -0,0 +1,100 @@
+"""Load test of main.py --serve: many clients sending commands at once
+
+    python -m benchmarks load [--connect ADDRESS] [--connections N] [--requests N]
+
+Without --connect a server is started on a temporary Unix socket with a
+generated book of --contacts contacts and stopped at the end. Every connection
+sends its share of a seeded command script (benchmarks.generators.make_script,
+without the commands that end the connection or list the whole book), one
+command at a time, and times each answer. The report gives requests per second
+and, per command, p50, p99 and max latency from instrument's histograms.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import instrument
+import server
+from benchmarks.generators import make_book, make_script
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKIPPED = ("good bye", "show all")
+
+
+async def connect(address):
+    target = server.parse_address(address)
+    if isinstance(target, tuple):
+        return await asyncio.open_connection(*target)
+    return await asyncio.open_unix_connection(target)
+
+
+async def client(address, lines):
+    reader, writer = await connect(address)
+    try:
+        for line in lines:
+            start = time.perf_counter()
+            writer.write(f"{line}\n".encode())
+            await writer.drain()
+            while await reader.readline() not in (server.END, b''):
+                pass
+            # unknown commands are timed together, not one by one
+            instrument.record(f"load.{line.split()[0].rstrip('0123456789')}", time.perf_counter() - start)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def load(address, connections, lines):
+    started = time.perf_counter()
+    await asyncio.gather(*(client(address, lines[i::connections]) for i in range(connections)))
+    return time.perf_counter() - started
+
+
+def start_server(folder, contacts):
+    """a main.py --serve process on a Unix socket in folder, with a book of contacts contacts"""
+    book_file = os.path.join(folder, 'book.bin')
+    address = os.path.join(folder, 'book.sock')
+    make_book(contacts).save_to_disk(book_file)
+    process = subprocess.Popen([sys.executable, 'main.py', '--serve', address, '--book', book_file],
+                               cwd=CODE, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while not os.path.exists(address):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("the server did not start")
+        time.sleep(0.05)
+    return process, address
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks load', description='Load test of main.py --serve.')
+    parser.add_argument('--connect', metavar='ADDRESS', help='a running server, host:port or a socket path')
+    parser.add_argument('--contacts', type=int, default=10_000, metavar='N',
+                        help='contacts in the book of the server started without --connect')
+    parser.add_argument('--connections', type=int, default=50, metavar='N')
+    parser.add_argument('--requests', type=int, default=20_000, metavar='N', help='commands over all connections')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    lines = [line for line in make_script(args.requests * 2, args.seed) if not line.startswith(SKIPPED)]
+    lines = lines[:args.requests]
+    instrument.reset()
+    with tempfile.TemporaryDirectory() as folder:
+        process = None
+        address = args.connect
+        if address is None:
+            process, address = start_server(folder, args.contacts)
+        try:
+            elapsed = asyncio.run(load(address, args.connections, lines))
+        finally:
+            if process is not None:
+                # the server saves the book when terminated
+                process.terminate()
+                process.wait()
+    print(f"{len(lines)} requests over {args.connections} connections in {elapsed:.2f} s: "
+          f"{len(lines) / elapsed:.0f} requests/s")
+    print(instrument.report())
@@ -0,0 +1,466 @@
+"""Micro-benchmarks, each comparing one optimization with the code it replaced
+
+Run from Code/ as python -m benchmarks micro [name ...].
+"""
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from classes import AddressBook, Record
+from benchmarks.generators import iter_contacts, make_book, make_names, make_script, make_tree, misspell
+import fuzzy
+import sort
+import instrument
+import names
+from pager import Pager
+import transfer
+
+
+def bench_find(sizes=(1_000, 10_000, 100_000), lookups=10_000):
+    """lookup latency of AddressBook.find must stay flat as the book grows"""
+    print(f"{'contacts':>10} {'find, us':>10}")
+    for size in sizes:
+        book = make_book(size)
+        rnd = random.Random(size)
+        names = [f"contact{rnd.randrange(size)}" for _ in range(lookups)]
+        elapsed = timeit.timeit(lambda: [book.find(name) for name in names], number=1)
+        print(f"{size:>10} {elapsed / lookups * 1e6:>10.3f}")
+
+
+def scan_search(book, query):
+    query = query.lower()
+    return [record for record in book.data.values()
+            if query in record.name.value.lower() or any(query in phone.value for phone in record.phones)]
+
+
+def bench_search(sizes=(1_000, 10_000, 100_000), queries=1_000):
+    """AddressBook.search_contacts against a full scan of the book"""
+    print(f"{'contacts':>10} {'index, us':>12} {'scan, us':>12}")
+    for size in sizes:
+        book = make_book(size)
+        rnd = random.Random(size)
+        words = [rnd.choice([f"contact{rnd.randrange(size)}", f"{rnd.randrange(10 ** 6):06d}"]) for _ in range(queries)]
+        book.search_index  # built on first use, keep it out of the timing
+        indexed = timeit.timeit(lambda: [book.search_contacts(word, 50) for word in words], number=1)
+        scanned = timeit.timeit(lambda: [scan_search(book, word) for word in words[:100]], number=1)
+        print(f"{size:>10} {indexed / queries * 1e6:>12.1f} {scanned / 100 * 1e6:>12.1f}")
+
+
+def scan_similar(book, name, limit=fuzzy.SUGGESTIONS, transliterate=True):
+    fold = fuzzy.skeleton if transliterate else str.casefold
+    term = fold(name)
+    max_distance = min(fuzzy.MAX_DISTANCE, max(1, len(term) // 4))
+    found = [(fuzzy.distance(term, fold(key), max_distance), key) for key in book.data]
+    found.sort(key=lambda item: (item[0], item[1].casefold(), item[1]))
+    return [key for edits, key in found[:limit] if edits <= max_distance]
+
+
+def check_fuzzy(count=2_000, queries=500, seed=0):
+    """similar_keys must find what comparing with every name finds, short names and
+    transliteration off included"""
+    rnd = random.Random(seed)
+    letters = 'abcdkoxjhsаб'
+    book = AddressBook()
+    while len(book) < count:
+        name = ''.join(rnd.choice(letters) for _ in range(rnd.randint(2, 10))).capitalize()
+        record = Record(name)
+        record.add_phone('0123456789')
+        book[name] = record
+    keys = list(book.data)
+    for _ in range(queries):
+        word = misspell(rnd.choice(keys), rnd)
+        for transliterate in (True, False):
+            expected = scan_similar(book, word, 10, transliterate)
+            found = book.similar_keys(word, 10, transliterate)
+            assert found == expected, (word, transliterate, found, expected)
+
+
+def bench_fuzzy(sizes=(1_000, 10_000, 100_000), queries=200):
+    """AddressBook.similar_keys on misspelled names against the distance to every name"""
+    check_fuzzy()
+    print(f"{'contacts':>10} {'build, ms':>10} {'index, us':>12} {'scan, us':>12} {'same':>5}")
+    for size in sizes:
+        book = AddressBook()
+        for name, phones, _ in iter_contacts(size):
+            record = Record(name)
+            record.add_phone(phones[0])
+            book[name] = record
+        rnd = random.Random(size)
+        keys = list(book.data)
+        words = [misspell(rnd.choice(keys), rnd) for _ in range(queries)]
+        built = timeit.timeit(lambda: book.fuzzy_index, number=1)
+        indexed = timeit.timeit(lambda: [book.similar_keys(word) for word in words], number=1)
+        scanned = timeit.timeit(lambda: [scan_similar(book, word) for word in words[:20]], number=1)
+        same = all(book.similar_keys(word) == scan_similar(book, word) for word in words[:20])
+        assert same, "similar_keys and the full scan disagree"
+        print(f"{size:>10} {built * 1e3:>10.1f} {indexed / queries * 1e6:>12.1f} {scanned / 20 * 1e6:>12.1f} "
+              f"{str(same):>5}")
+
+
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ru_maxrss survives exec on Linux and would report the parent's peak, VmHWM is reset
+LOAD_SCRIPT = """
+import sys, time
+from classes import AddressBook
+book = AddressBook()
+start = time.perf_counter()
+book.load_from_disk(sys.argv[1])
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as status:
+    peak = next(line.split()[1] for line in status if line.startswith('VmHWM'))
+print(len(book), elapsed, peak)
+"""
+
+
+def measure_load(filename):
+    """load a saved book in a fresh interpreter, return (contacts, seconds, peak RSS in KiB)"""
+    output = subprocess.run([sys.executable, '-c', LOAD_SCRIPT, filename], capture_output=True, text=True,
+                            cwd=CODE, check=True).stdout
+    count, elapsed, rss = output.split()[-3:]
+    return int(count), float(elapsed), int(rss)
+
+
+def bench_storage(size=1_000_000):
+    """load time and peak RSS of the binary format against the legacy pickle"""
+    book = make_book(size)
+    with tempfile.TemporaryDirectory() as folder:
+        binary = os.path.join(folder, 'book.bin')
+        legacy = os.path.join(folder, 'book.pkl')
+        book.save_to_disk(binary)
+        with open(legacy, 'wb') as file:
+            pickle.dump([record.to_dict() for record in book.data.values()], file)
+        del book
+        print(f"{'format':>8} {'contacts':>10} {'size, MB':>9} {'load, s':>8} {'RSS, MB':>8}")
+        for name, filename in (('pickle', legacy), ('binary', binary)):
+            count, elapsed, rss = measure_load(filename)
+            size_mb = os.path.getsize(filename) / 2 ** 20
+            print(f"{name:>8} {count:>10} {size_mb:>9.1f} {elapsed:>8.2f} {rss / 1024:>8.1f}")
+
+
+def bench_memory(size=1_000_000):
+    """bytes allocated per contact held in an AddressBook, traced with tracemalloc"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    book = make_book(size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{'contacts':>10} {'bytes/contact':>14}")
+    print(f"{len(book):>10} {(after - before) / size:>14.1f}")
+
+
+def bench_import(size=1_000_000):
+    """throughput of a CSV import into an empty book and of the export back"""
+    rnd = random.Random(size)
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, 'contacts.csv')
+        with open(source, 'w', newline='', encoding='utf-8') as file:
+            file.write('name,phones,birthday\n')
+            for i in range(size):
+                file.write(f"Contact{i},{rnd.randrange(10 ** 10):010d},{rnd.randint(1, 28):02d}-{rnd.randint(1, 12):02d}-{rnd.randint(1950, 2010)}\n")
+        book = AddressBook()
+        tracemalloc.start()
+        report = transfer.import_contacts(book, source)
+        # what the book holds is not pipeline overhead
+        held = tracemalloc.get_traced_memory()[0]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        exported = transfer.export_contacts(book, os.path.join(folder, 'export.csv'))
+    print(f"{'rows':>10} {'import rows/s':>14} {'export rows/s':>14} {'pipeline peak, MB':>18}")
+    print(f"{report['rows']:>10} {report['rows'] / report['seconds']:>14.0f} "
+          f"{exported['rows'] / exported['seconds']:>14.0f} {(peak - held) / 2 ** 20:>18.1f}")
+
+
+def listdir_walk(folder):
+    """the traversal sort.py used before: listdir, isfile and isdir per entry, recursion,
+    and a second os.walk pass looking for empty folders"""
+    for item in os.listdir(folder):
+        item_path = os.path.join(folder, item)
+        if os.path.isfile(item_path):
+            pass
+        elif os.path.isdir(item_path):
+            listdir_walk(item_path)
+
+
+def listdir_walk_and_clean(folder):
+    listdir_walk(folder)
+    for root, dirs, files in os.walk(folder, topdown=False):
+        for name in dirs:
+            os.listdir(os.path.join(root, name))
+
+
+def scandir_walk(folder):
+    for _ in sort.Sorter().scan_tree(folder, []):
+        pass
+
+
+def count_os_calls(function, *args):
+    """run function, return (seconds, {name: calls}) for the os functions that hit the filesystem"""
+    names = ('stat', 'lstat', 'listdir', 'scandir')
+    originals = {name: getattr(os, name) for name in names}
+    calls = dict.fromkeys(names, 0)
+
+    def counting(name):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return originals[name](*args, **kwargs)
+        return wrapper
+
+    for name in names:
+        setattr(os, name, counting(name))
+    try:
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start, calls
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+
+
+def bench_walk(files=500_000):
+    """filesystem calls and wall time of the sort.py traversal, the old one against scan_tree"""
+    with tempfile.TemporaryDirectory() as folder:
+        make_tree(folder, files)
+        print(f"{'walk':>12} {'files':>8} {'stat':>8} {'lstat':>8} {'listdir':>8} {'scandir':>8} {'seconds':>8}")
+        for name, function in (('listdir', listdir_walk_and_clean), ('scan_tree', scandir_walk)):
+            elapsed, calls = count_os_calls(function, folder)
+            print(f"{name:>12} {files:>8} {calls['stat']:>8} {calls['lstat']:>8} {calls['listdir']:>8} "
+                  f"{calls['scandir']:>8} {elapsed:>8.2f}")
+
+
+def first_dot_normalize(name):
+    """the normalize sort.py used before: split on the first dot, compile the pattern on every call"""
+    name, *extension = name.split('.')
+    new_name = name.translate(names.TRANS)
+    new_name = re.sub(r'\W', "_", new_name)
+    return f"{new_name}.{'.'.join(extension)}"
+
+
+def bench_normalize(count=1_000_000, distinct=50_000):
+    """normalizing file names: the first-dot version, normalize without and with its cache,
+    and giving every name a unique destination"""
+    items = make_names(count, distinct)
+    uncached = names.normalize_parts.__wrapped__
+    names.normalize_parts.cache_clear()
+    destinations = names.Destinations()
+    destinations.listings['target'] = set()
+    runs = (
+        ('first dot', lambda: [first_dot_normalize(name) for name, _ in items]),
+        ('uncached', lambda: [uncached(name, extension) for name, extension in items]),
+        ('cached', lambda: [names.normalize_parts(name, extension) for name, extension in items]),
+        ('unique', lambda: [destinations.reserve('target', *names.normalize_parts(name, extension))
+                            for name, extension in items]),
+    )
+    print(f"{'normalize':>10} {'names':>9} {'ns/name':>8}")
+    for label, run in runs:
+        elapsed = timeit.timeit(run, number=1)
+        print(f"{label:>10} {count:>9} {elapsed / count * 1e9:>8.0f}")
+    print(f"cache: {names.normalize_parts.cache_info()}")
+
+
+def format_contact(record):
+    return f"{record.name.value}:\n  Phone numbers: {', '.join(record.phone_values)}\n  Birthday: {record.birthday}\n"
+
+
+def show_all_string(book):
+    """what show all did before: one string with every contact"""
+    result = "All contacts:\n"
+    for record in book.data.values():
+        result += format_contact(record)
+    return result
+
+
+def bench_pager(sizes=(10_000, 100_000, 1_000_000), pages=100):
+    """show all as one string against the key snapshot and a page of the Pager"""
+    print(f"{'contacts':>10} {'string, ms':>11} {'snapshot, ms':>13} {'page, us':>9}")
+    for size in sizes:
+        book = make_book(size)
+        whole = timeit.timeit(lambda: show_all_string(book), number=1)
+        snapshot = timeit.timeit(book.sorted_keys, number=1)
+        pager = Pager(book, book.sorted_keys(), format_contact, "All contacts")
+        rnd = random.Random(size)
+        numbers = [rnd.randrange(pager.pages) for _ in range(pages)]
+        page = timeit.timeit(lambda: [pager.page(number) for number in numbers], number=1)
+        print(f"{size:>10} {whole * 1e3:>11.1f} {snapshot * 1e3:>13.1f} {page / pages * 1e6:>9.1f}")
+
+
+def startswith_choice_action(data, commands):
+    """the dispatch main.py used before: startswith against every command in turn"""
+    for command in commands:
+        if data.startswith(command):
+            args = data[len(command):].strip()
+            return commands[command], args if args else None
+    return None, None
+
+
+def bench_router(lines=100_000, extra_commands=200):
+    """routing and splitting the arguments of a command script: the startswith scan against the
+    Router trie, with the commands of main.py and with extra_commands more registered"""
+    import main
+    from router import Router
+    script = make_script(lines)
+    legacy = dict(main.commands)
+    # the old table needed the space to keep 'birthday' apart from the commands after it
+    legacy["birthday "] = legacy.pop("birthday")
+
+    def scan(table):
+        for line in script:
+            function, args = startswith_choice_action(line, table)
+            if args:
+                args.split(" ")
+
+    print(f"{'dispatch':>12} {'commands':>9} {'lines':>8} {'us/line':>8}")
+    for count in (0, extra_commands):
+        # placed first, so the scan has to pass them on every line
+        extra = {f"command{i} sub": None for i in range(count)}
+        table = {**extra, **legacy}
+        router = Router({**extra, **main.commands}, main.aliases, main.unknown_command)
+        for label, run in (('startswith', lambda: scan(table)),
+                           ('router', lambda: [router.route(line) for line in script])):
+            elapsed = timeit.timeit(run, number=1)
+            print(f"{label:>12} {len(table):>9} {lines:>8} {elapsed / lines * 1e6:>8.2f}")
+
+
+def bench_script(lines=100_000, save_every=(0, 1000, 100)):
+    """main.py --script: lines per second of a command script, with output to a null device
+    and the book saved at the end or every save_every changes"""
+    import main
+    script = [line for line in make_script(lines) if not line.startswith(("good bye", "show all", "search"))]
+    print(f"{'save every':>10} {'lines':>8} {'lines/s':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for every in save_every:
+            main.address_book = main.AddressBook()
+            book_file = os.path.join(folder, f"book{every}.bin")
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w', buffering=main.OUTPUT_BUFFER)
+            try:
+                elapsed = timeit.timeit(lambda: main.run_script(script, book_file, every), number=1)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            print(f"{every or 'end':>10} {len(script):>8} {len(script) / elapsed:>9.0f}")
+
+
+def bench_sqlite(sizes=(10_000, 100_000, 1_000_000), lookups=2_000):
+    """the in-memory AddressBook against SQLiteAddressBook: building the book, find, search,
+    a page of show all, and the Python memory the book holds"""
+    from database import SQLiteAddressBook
+    print(f"{'book':>7} {'contacts':>9} {'build, s':>9} {'find, us':>9} {'search, us':>11} "
+          f"{'page, us':>9} {'memory, MB':>11}")
+    for size in sizes:
+        rnd = random.Random(size)
+        names = [f"Contact{rnd.randrange(size)}" for _ in range(lookups)]
+        queries = [f"contact{rnd.randrange(size)}"[:rnd.randrange(8, 13)] for _ in range(lookups // 10)]
+        with tempfile.TemporaryDirectory() as folder:
+            for label in ('memory', 'sqlite'):
+                tracemalloc.start()
+                start = time.perf_counter()
+                book = AddressBook() if label == 'memory' else SQLiteAddressBook(os.path.join(folder, 'book.db'))
+                book.add_records(make_book(size).values())
+                if label == 'memory':
+                    book.search_index  # built on first use
+                build = time.perf_counter() - start
+                held = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+                find = timeit.timeit(lambda: [book.find(name) for name in names], number=1)
+                search = timeit.timeit(lambda: [book.search_contacts(query, 20) for query in queries], number=1)
+                keys = book.sorted_keys()
+                page = timeit.timeit(lambda: [next(book.iterator(20, keys, rnd.randrange(size))) for _ in names],
+                                     number=1)
+                print(f"{label:>7} {size:>9} {build:>9.2f} {find / lookups * 1e6:>9.1f} "
+                      f"{search / len(queries) * 1e6:>11.1f} {page / lookups * 1e6:>9.1f} {held / 2 ** 20:>11.1f}")
+                if label == 'sqlite':
+                    book.close()
+                del book, keys
+
+
+def bench_instrument(size=100_000, lookups=200_000):
+    """cost of instrumentation on AddressBook.find: not wrapped, wrapped while disabled, enabled"""
+    book = make_book(size)
+    rnd = random.Random(size)
+    names = [f"contact{rnd.randrange(size)}" for _ in range(lookups)]
+    find = AddressBook.find
+    print(f"{'find':>10} {'us/call':>8}")
+    try:
+        for label in ('plain', 'disabled', 'enabled'):
+            if label == 'disabled':
+                instrument.wrap(AddressBook, ('find',), 'book')
+            elif label == 'enabled':
+                instrument.enable()
+            elapsed = timeit.timeit(lambda: [book.find(name) for name in names], number=1)
+            print(f"{label:>10} {elapsed / lookups * 1e6:>8.3f}")
+    finally:
+        AddressBook.find = find
+        instrument.disable()
+    print(instrument.report())
+    instrument.reset()
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+main.address_book.load_from_disk(sys.argv[1], lazy=sys.argv[2] == 'lazy')
+record = main.address_book.find(sys.argv[3])
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as status:
+    peak = next(line.split()[1] for line in status if line.startswith('VmHWM'))
+print(record is not None, imported, elapsed, peak)
+"""
+
+
+def bench_startup(sizes=(10_000, 100_000, 1_000_000)):
+    """a fresh main.py up to the answer of one lookup: importing main, then loading the whole
+    book against opening it lazily and reading one record"""
+    print(f"{'load':>6} {'contacts':>9} {'import, ms':>11} {'first find, ms':>15} {'RSS, MB':>8}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'book.bin')
+            make_book(size).save_to_disk(filename)
+            for mode in ('eager', 'lazy'):
+                output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, filename, mode, f"contact{size // 2}"],
+                                        capture_output=True, text=True, cwd=CODE, check=True).stdout
+                found, imported, elapsed, rss = output.split()[-4:]
+                assert found == 'True'
+                print(f"{mode:>6} {size:>9} {float(imported) * 1e3:>11.1f} {float(elapsed) * 1e3:>15.1f} "
+                      f"{int(rss) / 1024:>8.1f}")
+
+
+benchmarks = {
+    'find': bench_find,
+    'search': bench_search,
+    'fuzzy': bench_fuzzy,
+    'storage': bench_storage,
+    'memory': bench_memory,
+    'import': bench_import,
+    'walk': bench_walk,
+    'normalize': bench_normalize,
+    'pager': bench_pager,
+    'router': bench_router,
+    'script': bench_script,
+    'sqlite': bench_sqlite,
+    'instrument': bench_instrument,
+    'startup': bench_startup,
+}
+
+
+def main(argv=None):
+    names = (sys.argv[1:] if argv is None else argv) or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(benchmarks)}")
+            sys.exit(1)
+        print(f"\n== {name} ==")
+        benchmarks[name]()
+
+
+if __name__ == "__main__":
+    main()
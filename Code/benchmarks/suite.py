@@ -0,0 +1,303 @@
+"""The benchmark suite: the address book and sort.py on generated data, as JSON
+
+Every case builds its input with benchmarks.generators from the seed, runs the
+operation repeat times and keeps the best run, in microseconds per operation.
+Results are keyed 'case/size', so two runs with the same sizes and seed can be
+compared: --baseline reads an earlier --output file and the suite exits with 1
+when a case got slower by more than --threshold.
+
+    python -m benchmarks --sizes 1000,100000 --output base.json
+    python -m benchmarks --sizes 1000,100000 --baseline base.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from classes import AddressBook, Record
+from benchmarks.generators import iter_contacts, make_empty_folders, make_tree, misspell
+import sort
+
+SIZES = (1_000, 10_000, 100_000)
+TREE_FILES = 10_000
+LOOKUPS = 10_000
+THRESHOLD = 0.2
+CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_book(size, seed):
+    book = AddressBook()
+    for name, phones, birthday in iter_contacts(size, seed):
+        record = Record(name, birthday)
+        for phone in phones:
+            record.add_phone(phone)
+        book.add_record(record)
+    return book
+
+
+def sample(book, count, seed):
+    rnd = random.Random(seed)
+    keys = list(book.data)
+    return [rnd.choice(keys) for _ in range(count)]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_add_record(size, seed):
+    """Record with validated Latin and Cyrillic names, phones and a birthday, added to the book"""
+    return timed(build_book, size, seed), size
+
+
+def bench_find(size, seed, book):
+    names = [name.lower() for name in sample(book, LOOKUPS, seed)]
+    return timed(lambda: [book.find(name) for name in names]), len(names)
+
+
+def bench_search_contacts(size, seed, book):
+    rnd = random.Random(seed)
+    queries = [rnd.choice((name.split()[0][:4], name.split()[-1], name.split()[1]))
+               for name in sample(book, LOOKUPS // 10, seed)]
+    queries += [f"{rnd.randrange(1000):03d}" for _ in range(len(queries))]
+    book.search_index  # built on first use, that is not a search
+    return timed(lambda: [book.search_contacts(query, 20) for query in queries]), len(queries)
+
+
+def bench_similar_keys(size, seed, book):
+    rnd = random.Random(seed)
+    words = [misspell(name, rnd) for name in sample(book, LOOKUPS // 200, seed)]
+    book.fuzzy_index  # built on first use, like the search index
+    return timed(lambda: [book.similar_keys(word) for word in words]), len(words)
+
+
+def bench_days_to_birthday(size, seed, book):
+    records = [record for record in book.data.values() if record.birthday is not None]
+    return timed(lambda: [record.days_to_birthday() for record in records]), len(records)
+
+
+def bench_save_to_disk(size, seed, book):
+    with tempfile.TemporaryDirectory() as folder:
+        elapsed = timed(book.save_to_disk, os.path.join(folder, 'book.bin'))
+        book.journal.close()
+        book.journal = None
+    return elapsed, len(book)
+
+
+def bench_load_from_disk(size, seed, book):
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'book.bin')
+        book.save_to_disk(filename)
+        book.journal.close()
+        book.journal = None
+        loaded = AddressBook()
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = timed(loaded.load_from_disk, filename)
+        loaded.journal.close()
+    return elapsed, len(loaded)
+
+
+def bench_lazy_find(size, seed, book):
+    """load_from_disk(lazy=True) and one find, what main.py does before its first answer"""
+    names = sample(book, 100, seed)
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'book.bin')
+        book.save_to_disk(filename)
+        book.journal.close()
+        book.journal = None
+        start = time.perf_counter()
+        for name in names:
+            loaded = AddressBook()
+            with contextlib.redirect_stdout(io.StringIO()):
+                loaded.load_from_disk(filename, lazy=True)
+            loaded.find(name)
+            loaded.journal.close()
+            loaded._close_snapshot()
+        return time.perf_counter() - start, len(names)
+
+
+def bench_import(module, seed):
+    """python -X importtime -c 'import module' in a fresh interpreter, the import alone"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, cwd=CODE, check=True).stderr
+    # the last line is the module itself: 'import time: self | cumulative | name', in us
+    cumulative = int(output.strip().splitlines()[-1].split('|')[1])
+    return cumulative / 1e6, 1
+
+
+def bench_process_folder(files, seed):
+    """Sorter.run on a tree of files with mixed extensions, one in fifty a zip archive"""
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, 'source')
+        make_tree(source, files, per_folder=500, depth=3, seed=seed, archives=0.02)
+        # the category folders are made in the current directory
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = timed(sort.Sorter().run, source)
+        finally:
+            os.chdir(cwd)
+    return elapsed, files
+
+
+def bench_remove_empty_folders(files, seed):
+    """Sorter.run on nested empty folders, about as many as files: the scan plans an rmdir
+    for every folder left empty and the executor removes them"""
+    depth = max(1, round(math.log10(files)))
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, 'source')
+        make_empty_folders(source, fanout=10, depth=depth)
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed = timed(sort.Sorter().run, source)
+        finally:
+            os.chdir(cwd)
+        assert os.listdir(source) == []
+    # every level of folders is removed, not just the leaves
+    return elapsed, sum(10 ** level for level in range(1, depth + 1))
+
+
+# cases on a book of each size, built once per size and seed; the rest make their own input
+book_cases = {
+    'find': bench_find,
+    'search_contacts': bench_search_contacts,
+    'similar_keys': bench_similar_keys,
+    'days_to_birthday': bench_days_to_birthday,
+    'save_to_disk': bench_save_to_disk,
+    'load_from_disk': bench_load_from_disk,
+    'lazy_find': bench_lazy_find,
+}
+size_cases = {
+    'add_record': bench_add_record,
+}
+# the size of these is the module imported, import/main is the startup time of main.py
+startup_cases = {
+    'import': bench_import,
+}
+STARTUP_MODULES = ('main', 'classes')
+tree_cases = {
+    'process_folder': bench_process_folder,
+    'remove_empty_folders': bench_remove_empty_folders,
+}
+
+
+def best(run, repeat):
+    """(us per operation, operations) of the fastest of repeat runs"""
+    runs = [run() for _ in range(repeat)]
+    elapsed, operations = min(runs, key=lambda result: result[0] / max(result[1], 1))
+    return elapsed / max(operations, 1) * 1e6, operations
+
+
+def run_suite(sizes=SIZES, tree_files=TREE_FILES, seed=0, repeat=3, cases=None, log=print):
+    """{'meta': {...}, 'results': {'case/size': {'us_per_op': ..., 'ops': ...}}}"""
+    results = {}
+
+    def add(case, size, run):
+        if cases and case not in cases:
+            return
+        us, operations = best(run, repeat)
+        results[f"{case}/{size}"] = {'us_per_op': round(us, 3), 'ops': operations}
+        log(f"{case + '/' + str(size):<32} {us:>12.3f} us/op {operations:>10} ops")
+
+    for size in sizes:
+        for case, function in size_cases.items():
+            add(case, size, lambda: function(size, seed))
+        if cases and not set(cases) & set(book_cases):
+            continue
+        book = build_book(size, seed)
+        for case, function in book_cases.items():
+            add(case, size, lambda: function(size, seed, book))
+        del book
+    for case, function in startup_cases.items():
+        for module in STARTUP_MODULES:
+            add(case, module, lambda: function(module, seed))
+    if tree_files:
+        for case, function in tree_cases.items():
+            add(case, tree_files, lambda: function(tree_files, seed))
+    meta = {
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': list(sizes),
+        'tree_files': tree_files,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """lines describing every case slower than in baseline by more than threshold, a fraction"""
+    regressions = []
+    for key, result in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None or not before['us_per_op']:
+            continue
+        change = result['us_per_op'] / before['us_per_op'] - 1
+        if change > threshold:
+            regressions.append(f"{key}: {before['us_per_op']:.3f} -> {result['us_per_op']:.3f} us/op "
+                               f"(+{change:.0%})")
+    return regressions
+
+
+def parse_sizes(text):
+    try:
+        return tuple(int(size.replace('_', '')) for size in text.split(',') if size.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a list of numbers: {text}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Time the address book and sort.py on generated data.',
+                                     epilog='Run "python -m benchmarks micro [name ...]" for the micro-benchmarks.')
+    parser.add_argument('--sizes', type=parse_sizes, default=SIZES, metavar='N,N',
+                        help='numbers of contacts in the generated books')
+    parser.add_argument('--tree-files', type=int, default=TREE_FILES, metavar='N',
+                        help='files in the generated tree for sort.py, 0 to skip')
+    parser.add_argument('--case', action='append', dest='cases', metavar='NAME',
+                        choices=[*size_cases, *book_cases, *startup_cases, *tree_cases], help='run only this case, can repeat')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, metavar='N', help='runs per case, the best one counts')
+    parser.add_argument('--output', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='JSON of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, metavar='FRACTION',
+                        help='slowdown against the baseline that counts as a regression')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read the baseline: {e}")
+        if baseline['meta'].get('seed') != args.seed:
+            print(f"Warning: the baseline was made with seed {baseline['meta'].get('seed')}", file=sys.stderr)
+
+    current = run_suite(args.sizes, args.tree_files, args.seed, args.repeat, args.cases)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(current, file, indent=1)
+    if baseline is None:
+        return 0
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+        print('\n'.join(regressions))
+        return 1
+    print(f"\nNo regressions over {args.threshold:.0%}")
+    return 0
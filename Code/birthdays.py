@@ -0,0 +1,60 @@
+import calendar
+from datetime import date, timedelta
+
+from search import SortedTerms
+
+
+def birthday_in(year, birthday):
+    """date the birthday falls on in year, Feb 29 is celebrated on Feb 28 in common years"""
+    if birthday.month == 2 and birthday.day == 29 and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return birthday.replace(year=year)
+
+
+def next_birthday(birthday, today):
+    """the first birthday on or after today"""
+    upcoming = birthday_in(today.year, birthday)
+    if upcoming < today:
+        upcoming = birthday_in(today.year + 1, birthday)
+    return upcoming
+
+
+class BirthdayIndex:
+    """(month, day, record key) of every birthday kept sorted, so the birthdays
+    of the next days are a range scan instead of a pass over the whole book"""
+
+    def __init__(self, entries=None):
+        # anything with iter_from over (month, day, key) in order, SQLiteAddressBook reads its table
+        self.entries = entries if entries is not None else SortedTerms()
+
+    def clear(self):
+        self.entries.clear()
+
+    def add(self, key, birthday):
+        self.entries.add((birthday.month, birthday.day, key))
+
+    def remove(self, key, birthday):
+        self.entries.remove((birthday.month, birthday.day, key))
+
+    def _between(self, year, first, last, stop=(13, 1)):
+        """(date, key) of entries from first to last inclusive and before stop,
+        all given as (month, day), celebrated in year"""
+        if last == (2, 28) and not calendar.isleap(year):
+            # Feb 29 birthdays are on Feb 28 this year
+            last = (2, 29)
+        for month, day, key in self.entries.iter_from(first):
+            if (month, day) > last or (month, day) >= stop:
+                break
+            yield birthday_in(year, date(2000, month, day)), key
+
+    def upcoming(self, days, today):
+        """(date, key) of birthdays from today to today + days inclusive, soonest first"""
+        end = today + timedelta(days=days)
+        start = (today.month, today.day)
+        if end.year == today.year:
+            yield from self._between(today.year, start, (end.month, end.day))
+            return
+        yield from self._between(today.year, start, (12, 31))
+        # birthdays from start on are already listed, so a window of a year or more stops there
+        last = (end.month, end.day) if end.year == today.year + 1 else (12, 31)
+        yield from self._between(today.year + 1, (1, 1), last, stop=start)
@@ -0,0 +1,130 @@
+"""Categories of files for sort.py and the extensions that belong to them
+
+A Registry is built once from DEFAULT_CATEGORIES, optionally extended from a
+JSON config file, and maps extensions to categories with a dict lookup.
+Extensions may have several parts, like 'tar.gz'; the longest registered
+suffix of a name wins. Files whose extension is missing or unknown can be
+classified by sniff, which looks at their first bytes only.
+
+A config file maps category names to a list of extensions, or to an object
+with 'extensions' and optionally 'folder' and 'title' for a new category:
+
+    {"images": ["heic", "webp"],
+     "books": {"folder": "books", "title": "Books", "extensions": ["epub", "fb2"]}}
+"""
+import json
+from collections import namedtuple
+
+Category = namedtuple('Category', 'name folder title kind extensions extract', defaults=(False,))
+
+DEFAULT_CATEGORIES = (
+    Category('images', 'images', 'Images', 'image', ('jpeg', 'png', 'jpg', 'svg')),
+    Category('video', 'video', 'Video', 'video', ('avi', 'mp4', 'mov', 'mkv')),
+    Category('documents', 'documents', 'Documents', 'document', ('doc', 'docx', 'txt', 'pdf', 'xlsx', 'pptx')),
+    Category('audio', 'audio', 'Audio', 'audio', ('mp3', 'ogg', 'wav', 'amr')),
+    Category('archives', 'archives', 'Archives', 'archive',
+             ('zip', 'gz', 'tar', 'tgz', 'bz2', 'tbz2', 'xz', 'txz', 'tar.gz', 'tar.bz2', 'tar.xz'), True),
+)
+OTHERS = Category('others', 'others', 'Others', 'other', ())
+
+SNIFF_SIZE = 262
+# (offset, magic bytes, category name), the first match wins
+MAGIC = (
+    (0, b'\xff\xd8\xff', 'images'),
+    (0, b'\x89PNG\r\n\x1a\n', 'images'),
+    (0, b'GIF87a', 'images'),
+    (0, b'GIF89a', 'images'),
+    (0, b'%PDF-', 'documents'),
+    (0, b'ID3', 'audio'),
+    (0, b'OggS', 'audio'),
+    (0, b'#!AMR', 'audio'),
+    (8, b'WAVE', 'audio'),
+    (8, b'AVI ', 'video'),
+    (4, b'ftyp', 'video'),
+    (0, b'\x1a\x45\xdf\xa3', 'video'),
+    (0, b'PK\x03\x04', 'archives'),
+    (0, b'\x1f\x8b', 'archives'),
+    (0, b'BZh', 'archives'),
+    (0, b'\xfd7zXZ\x00', 'archives'),
+    (257, b'ustar', 'archives'),
+)
+
+
+class Registry:
+
+    def __init__(self, categories=DEFAULT_CATEGORIES):
+        self.categories = []
+        self.by_name = {}
+        self.by_extension = {}
+        self.longest = 1
+        for category in categories:
+            self.add(category)
+
+    def add(self, category):
+        """register a category, or more extensions for one registered under the same name"""
+        known = self.by_name.get(category.name)
+        added = tuple(category.extensions)
+        if known is not None:
+            category = category._replace(extensions=known.extensions + added)
+            self.categories[self.categories.index(known)] = category
+            for extension, owner in self.by_extension.items():
+                if owner is known:
+                    self.by_extension[extension] = category
+        else:
+            self.categories.append(category)
+        self.by_name[category.name] = category
+        for extension in added:
+            extension = extension.lower().lstrip('.')
+            # a later registration takes an extension over
+            self.by_extension[extension] = category
+            self.longest = max(self.longest, extension.count('.') + 1)
+
+    @property
+    def folders(self):
+        return tuple(category.folder for category in self.categories) + (OTHERS.folder,)
+
+    def match(self, name):
+        """(category, matched extension) of a file name, (None, '') when no extension is registered"""
+        parts = name.lower().split('.')[1:]
+        for start in range(max(0, len(parts) - self.longest), len(parts)):
+            extension = '.'.join(parts[start:])
+            category = self.by_extension.get(extension)
+            if category is not None:
+                return category, extension
+        return None, ''
+
+    def sniff(self, path):
+        """category of a file judging by its first bytes, None when they tell nothing"""
+        try:
+            with open(path, 'rb') as file:
+                head = file.read(SNIFF_SIZE)
+        except OSError:
+            return None
+        for offset, magic, name in MAGIC:
+            if head.startswith(magic, offset):
+                return self.by_name.get(name)
+        return None
+
+
+def load_registry(filename=None):
+    """the default registry, extended from the config file filename when given"""
+    registry = Registry()
+    if filename is None:
+        return registry
+    with open(filename, encoding='utf-8') as file:
+        config = json.load(file)
+    if not isinstance(config, dict):
+        raise ValueError(f"{filename}: expected an object of categories")
+    for name, value in config.items():
+        if isinstance(value, list):
+            value = {'extensions': value}
+        if not isinstance(value, dict) or not isinstance(value.get('extensions'), list):
+            raise ValueError(f"{filename}: {name} needs a list of extensions")
+        known = registry.by_name.get(name)
+        registry.add(Category(name,
+                              value.get('folder', known.folder if known else name),
+                              value.get('title', known.title if known else name.capitalize()),
+                              value.get('kind', known.kind if known else name),
+                              tuple(value['extensions']),
+                              known.extract if known else False))
+    return registry
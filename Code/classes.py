@@ -1,10 +1,17 @@
-from datetime import datetime
 from collections import UserDict
-import re
-import pickle
+import os
+from search import SearchIndex
+import storage
+import journal
+from validators import validate_name, validate_phone, parse_birthday, validate_many
+
+# the journal is folded into a new snapshot on save once it outgrows both of these
+COMPACT_MIN_BYTES = 1 << 20
+COMPACT_RATIO = 0.5
 
 class Field:
-    
+    __slots__ = ('__value',)
+
     def __init__(self, value):
         self.__value = None
         self.value = value
@@ -21,104 +28,141 @@ class Field:
     def _validate(self, value):
         pass
 
+    @classmethod
+    def trusted(cls, value):
+        """build a field from already validated data without running _validate"""
+        field = cls.__new__(cls)
+        field.__value = value
+        return field
+
     def __str__(self):
         return str(self.__value)
 
 class Name(Field):
     """class for validate name field"""
+    __slots__ = ()
 
     def _validate(self, value):
-        name_pattern = re.compile(r'^[a-zA-Z0-9а-яА-Я\s]+$')
-
-        if len(value) < 1 or not name_pattern.match(value):
-            raise ValueError("Invalid name format")
-        
+        validate_name(value)
         return f'{value} is a valid name'
         
 class Phone(Field):
     """class for validate phone field"""
+    __slots__ = ()
 
     def _validate(self, value):
-        if len(value) != 10 or not value.isdigit():
-            raise ValueError("Phone number must be 10 digits")
-        
+        validate_phone(value)
         return f'{value} is valid phone number'
 
+    @staticmethod
+    def pack(value):
+        """valid phones are exactly 10 ascii digits, records keep them as ints"""
+        return int(value)
+
+    @staticmethod
+    def unpack(number):
+        return f'{number:010d}'
+
 class Birthday(Field):
     """class for validating birthday field"""
+    __slots__ = ('_date',)
 
     def _validate(self, value):
-        separators = ["-", "/", " ", "."]
-        day, month, year = None, None, None
-
-        for sep in separators:
-            if sep in value:
-                try:
-                    day, month, year = map(int, value.split(sep))
-                    break
-                except ValueError:
-                    pass
-
-        if day is None or month is None or year is None:
-            raise ValueError('Incorrect date format. Must be in dd-mm-yyyy, dd/mm/yyyy, dd mm yyyy, or dd.mm.yyyy')
-
-        if 1 <= day <= 31 and 1 <= month <= 12 and len(str(year)) == 4:
-            return f'{value} is valid birthday'
-        else:
-            raise ValueError('Invalid date: {value}. The date is not correct.')
+        self._date = parse_birthday(value)
+        return f'{value} is valid birthday'
+
+    @property
+    def date(self):
+        """the birthday as datetime.date, parsed once"""
+        try:
+            return self._date
+        except AttributeError:
+            # built by Field.trusted, the value has not been parsed yet
+            self._date = parse_birthday(self.value)
+            return self._date
 
 
 class Record:
+    # phones are packed with Phone.pack, Phone objects are only built when asked for
+    __slots__ = ('name', '_phones', 'birthday', 'book')
+
     def __init__(self, name, birthday=None):
         self.name = Name(name)
-        self.phones = []
+        self._phones = ()
         self.birthday = Birthday(birthday) if birthday else None
+        # AddressBook holding this record, notified about changes to keep its indexes in sync
+        self.book = None
+
+    @property
+    def phones(self):
+        """Phone objects built on each call, a tuple so that changes go through add_phone,
+        remove_phone and edit_phone, which keep the book's indexes and journal in sync"""
+        return tuple(Phone.trusted(Phone.unpack(number)) for number in self._phones)
+
+    @property
+    def phone_values(self):
+        return [Phone.unpack(number) for number in self._phones]
 
     def add_phone(self, phone):
-        self.phones.append(Phone(phone))
+        tel = Phone(phone)
+        self._phones += (Phone.pack(tel.value),)
+        if self.book is not None:
+            self.book.phone_added(self, tel.value)
         return f'Number phone {phone} has been add'
     
     def update_birthday(self, new_birthday):
+        old_birthday = self.birthday_date()
         if self.birthday is not None:
             self.birthday.value = new_birthday
         else:
             self.birthday = Birthday(new_birthday)
+        if self.book is not None:
+            self.book.birthday_changed(self, old_birthday)
+
+    def birthday_date(self):
+        """datetime.date of the birthday, None when it is not set or cannot be parsed"""
+        try:
+            return self.birthday.date if self.birthday is not None else None
+        except ValueError:
+            return None
 
     def remove_phone(self, phone):
         tel = Phone(phone)
-        if tel.value in [item.value for item in self.phones]:
-            self.phones = [item for item in self.phones if tel.value != item.value]
+        number = Phone.pack(tel.value)
+        count = self._phones.count(number)
+        if count:
+            self._phones = tuple(item for item in self._phones if item != number)
+            if self.book is not None:
+                self.book.phone_removed(self, tel.value, count)
             return f'Number phone {phone} has been removed from contact {self.name.value}.'
         else:
             return f'Phone number {phone} not found in contact {self.name.value}.'
 
     def edit_phone(self, phone_old, phone_new):
         tel_new = Phone(phone_new)
-        for item in self.phones:
-            if phone_old == item.value:
-                idx = self.phones.index(item)
-                self.phones.remove(item)
-                self.phones.insert(idx, tel_new)
+        for idx, item in enumerate(self._phones):
+            if phone_old == Phone.unpack(item):
+                self._phones = self._phones[:idx] + (Phone.pack(tel_new.value),) + self._phones[idx + 1:]
+                if self.book is not None:
+                    self.book.phone_changed(self, phone_old, tel_new.value)
                 return f'Number phone {phone_old} has been changed to {tel_new.value}'
         raise ValueError("Phone number not found for changing")
 
     def find_phone(self, phone):
         tel = Phone(phone)
-        return next((item for item in self.phones if tel.value == item.value), None)
+        index = self.book._search_index if self.book is not None else None
+        if index is not None and str(self.name) not in index.lookup_phone(tel.value):
+            return None
+        return tel if Phone.pack(tel.value) in self._phones else None
 
     def days_to_birthday(self):
-        today = datetime.now()
+        # datetime and birthdays are imported on first use, they are not needed to start main.py
+        import datetime
+        import birthdays
+        today = datetime.date.today()
 
         if self.birthday is not None and self.birthday.value is not None:
-            birth_day = self.birthday.value
-            birth_day = datetime.strptime(birth_day, "%d-%m-%Y")
-
-            next_birthday = datetime(today.year, birth_day.month, birth_day.day)
-
-            if today > next_birthday:
-                next_birthday = datetime(today.year + 1, birth_day.month, birth_day.day)
-
-            days_until_birthday = (next_birthday - today).days
+            days_until_birthday = (birthdays.next_birthday(self.birthday.date, today) - today).days
 
             return days_until_birthday
         else:
@@ -127,98 +171,444 @@ class Record:
     def to_dict(self):
         return {
             'name': self.name.value,
-            'phones': [phone.value for phone in self.phones],
+            'phones': self.phone_values,
             'birthday': self.birthday.value if (self.birthday and hasattr(self.birthday, 'value')) else None
         }
 
     @classmethod
-    def from_dict(cls, data):
-        record = cls(name=data['name'], birthday=data['birthday'])
-        for phone in data['phones']:
-            record.add_phone(phone)
+    def from_dict(cls, data, validate=True):
+        if validate:
+            record = cls(name=data['name'], birthday=data['birthday'])
+            for phone in data['phones']:
+                record.add_phone(phone)
+            return record
+        record = cls.__new__(cls)
+        record.name = Name.trusted(data['name'])
+        record._phones = tuple(Phone.pack(phone) for phone in data['phones'])
+        record.birthday = Birthday.trusted(data['birthday']) if data['birthday'] else None
+        record.book = None
         return record
             
     def __str__(self):
-        return f"Contact name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}"
+        return f"Contact name: {self.name.value}, phones: {'; '.join(self.phone_values)}"
+
+def valid_legacy_records(data):
+    """records of a pickled book ready to load; older versions checked less, so records with
+    an invalid name or phone are reported and skipped, an invalid birthday is reported and
+    dropped and the rest of its record kept"""
+    phone_rows = [row for row, item in enumerate(data) for _ in item['phones']]
+    errors, _ = validate_many(names=[item['name'] for item in data],
+                              phones=[phone for item in data for phone in item['phones']],
+                              birthdays=[item['birthday'] for item in data])
+    skipped, birthdays = {}, {}
+    for column, index, message in errors:
+        if column == 'birthday':
+            birthdays[index] = message
+        else:
+            skipped.setdefault(phone_rows[index] if column == 'phone' else index, f'{column}: {message}')
+    records = []
+    for row, item in enumerate(data):
+        if row in skipped:
+            print(f"Skipping record #{row + 1} ({item['name']}): {skipped[row]}")
+        elif row in birthdays:
+            print(f"Dropping the birthday of record #{row + 1} ({item['name']}): {birthdays[row]}")
+            records.append({**item, 'birthday': None})
+        else:
+            records.append(item)
+    return records
+
+def merge_record(book, record, existing):
+    """add record to book, or merge its new phones and its birthday into existing, the
+    record of the same name in book; True if merged. Every book merges by these rules"""
+    if existing is None:
+        book[str(record.name)] = record
+        return False
+    existing_phones = set(existing.phone_values)
+    for phone in record.phone_values:
+        if phone not in existing_phones:
+            existing.add_phone(phone)
+            existing_phones.add(phone)
+    if record.birthday:
+        existing.update_birthday(record.birthday.value)
+    return True
 
 class AddressBook(UserDict):
 
-    def add_record(self, obj):
-        key = str(obj.name)
-        if key in self.data:
-            existing_record = self.data[key]
-            for phone in obj.phones:
-                if phone not in existing_record.phones:
-                    existing_record.phones.append(phone)
-            if obj.birthday:
-                existing_record.birthday = obj.birthday
-            print(f"Information added to existing contact: {key}")
+    def __init__(self, *args, **kwargs):
+        # casefolded name -> key in self.data (a list of keys for names differing only
+        # by case), so find() does not scan the book
+        self.names = {}
+        # built on the first search and kept up to date from then on
+        self._search_index = None
+        self._birthday_index = None
+        self._fuzzy_index = None
+        # journal of changes since the last snapshot, attached by load_from_disk and save_to_disk
+        self.journal = None
+        self.generation = 0
+        # a book loaded lazily reads its records from this storage.Snapshot, a few at a time
+        # (see _fault) until anything needs all of them (see _materialize); self._data holds
+        # the records read so far and those added since, _faulted the casefolded names read,
+        # _deleted the keys deleted since
+        self._snapshot = None
+        self._faulted = set()
+        self._deleted = set()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def data(self):
+        if self._snapshot is not None:
+            self._materialize()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    def _fault(self, folded):
+        """read the records named folded, ignoring case, from the snapshot, once"""
+        if folded in self._faulted:
+            return
+        self._faulted.add(folded)
+        for record_data in self._snapshot.find(folded):
+            key = record_data['name']
+            record = Record.from_dict(record_data, validate=False)
+            record.book = self
+            self._data[key] = record
+            self._add_name(key)
+
+    def _get(self, key):
+        """the record stored under key or None, without loading the whole book"""
+        if self._snapshot is not None:
+            self._fault(key.casefold())
+        return self._data.get(key)
+
+    def _materialize(self):
+        """read the rest of a lazily loaded book; records changed or added since it was
+        opened take the place of those in the snapshot, new ones come after them"""
+        snapshot, self._snapshot = self._snapshot, None
+        changed, deleted = self._data, self._deleted
+        data = {}
+        for record_data in snapshot.records():
+            key = record_data['name']
+            if key in deleted:
+                continue
+            record = changed.get(key)
+            if record is None:
+                record = Record.from_dict(record_data, validate=False)
+                record.book = self
+            data[key] = record
+        snapshot.close()
+        for key, record in changed.items():
+            if key not in data:
+                data[key] = record
+        self._data = data
+        self._faulted = set()
+        self._deleted = set()
+        self.names.clear()
+        for key in data:
+            self._add_name(key)
+
+    def _close_snapshot(self):
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+            self._faulted.clear()
+            self._deleted.clear()
+
+    def _add_name(self, key):
+        folded = key.casefold()
+        existing = self.names.get(folded)
+        if existing is None:
+            self.names[folded] = key
+        elif isinstance(existing, list):
+            existing.append(key)
+        else:
+            self.names[folded] = [existing, key]
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            for key, record in self.data.items():
+                self._search_index.add_record(key, record)
+        return self._search_index
+
+    @property
+    def birthday_index(self):
+        if self._birthday_index is None:
+            import birthdays
+            self._birthday_index = birthdays.BirthdayIndex()
+            for key, record in self.data.items():
+                birthday = record.birthday_date()
+                if birthday is not None:
+                    self._birthday_index.add(key, birthday)
+        return self._birthday_index
+
+    @property
+    def fuzzy_index(self):
+        if self._fuzzy_index is None:
+            import fuzzy
+            self._fuzzy_index = fuzzy.FuzzyIndex()
+            for key in self.data:
+                self._fuzzy_index.add(key)
+        return self._fuzzy_index
+
+    def __setitem__(self, key, record):
+        existing = self._get(key)
+        if existing is not None:
+            self._detach(key, existing)
+        else:
+            self._add_name(key)
+        self._data[key] = record
+        record.book = self
+        if self._search_index is not None:
+            self._search_index.add_record(key, record)
+        if self._birthday_index is not None and record.birthday_date() is not None:
+            self._birthday_index.add(key, record.birthday_date())
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add(key)
+        if self.journal is not None:
+            self.journal.append(journal.ADD_RECORD, record.to_dict())
+
+    def __delitem__(self, key):
+        if self._snapshot is not None:
+            self._fault(key.casefold())
+        self._detach(key, self._data.pop(key))
+        if self._snapshot is not None:
+            self._deleted.add(key)
+        if self.journal is not None:
+            self.journal.append(journal.DELETE, key)
+        folded = key.casefold()
+        existing = self.names[folded]
+        if isinstance(existing, list):
+            existing.remove(key)
+            if len(existing) == 1:
+                self.names[folded] = existing[0]
         else:
-            self.data[key] = obj
+            del self.names[folded]
+
+    def _detach(self, key, record):
+        if self._search_index is not None:
+            self._search_index.remove_record(key, record)
+        if self._birthday_index is not None and record.birthday_date() is not None:
+            self._birthday_index.remove(key, record.birthday_date())
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.remove(key)
+        record.book = None
+
+    def _clear(self):
+        self._close_snapshot()
+        for record in self._data.values():
+            record.book = None
+        self._data.clear()
+        self.names.clear()
+        self._search_index = None
+        self._birthday_index = None
+        self._fuzzy_index = None
+        if self.journal is not None:
+            self.journal.append(journal.CLEAR)
+
+    def phone_added(self, record, phone):
+        if self._search_index is not None:
+            self._search_index.add_phone(str(record.name), phone)
+        if self.journal is not None:
+            self.journal.append(journal.ADD_PHONE, str(record.name), phone)
+
+    def phone_removed(self, record, phone, count=1):
+        if self._search_index is not None:
+            self._search_index.remove_phone(str(record.name), phone, count)
+        if self.journal is not None:
+            self.journal.append(journal.REMOVE_PHONE, str(record.name), phone)
+
+    def phone_changed(self, record, old_phone, new_phone):
+        if self._search_index is not None:
+            self._search_index.remove_phone(str(record.name), old_phone)
+            self._search_index.add_phone(str(record.name), new_phone)
+        if self.journal is not None:
+            self.journal.append(journal.EDIT_PHONE, str(record.name), old_phone, new_phone)
+
+    def birthday_changed(self, record, old_birthday):
+        if self._birthday_index is not None:
+            if old_birthday is not None:
+                self._birthday_index.remove(str(record.name), old_birthday)
+            self._birthday_index.add(str(record.name), record.birthday.date)
+        if self.journal is not None:
+            self.journal.append(journal.UPDATE_BIRTHDAY, str(record.name), record.birthday.value)
+
+    def _merge(self, obj):
+        """add a record or merge it into the contact with the same name, True if merged"""
+        return merge_record(self, obj, self._get(str(obj.name)))
+
+    def add_record(self, obj):
+        if self._merge(obj):
+            print(f"Information added to existing contact: {obj.name}")
+
+    def add_records(self, records):
+        """add or merge many records at once, return (added, merged) counts"""
+        added = merged = 0
+        for record in records:
+            if self._merge(record):
+                merged += 1
+            else:
+                added += 1
+        return added, merged
 
     def find(self, name):
-        for record in self.data.values():
-            if name.lower() == record.name.value.lower():
-                return record
-        return None
+        folded = name.casefold()
+        if self._snapshot is not None:
+            self._fault(folded)
+        key = self.names.get(folded)
+        if isinstance(key, list):
+            key = key[0]
+        return self._data[key] if key is not None else None
     
-    def clear_all_contacts(self):
-        yes_no = input('Are you sure you want to delete all users? (y/n) ').lower().strip()
-        if yes_no == 'y':
-            self.data.clear()
-            print("All contacts cleared.")
-        else:
-             print('Removal canceled')
+    def clear_all_contacts(self, answer=None):
+        """clear the book if answer is 'y', asked for when not given"""
+        if answer is None:
+            answer = input('Are you sure you want to delete all users? (y/n) ')
+        if answer.lower().strip() == 'y':
+            self._clear()
+            return "All contacts cleared."
+        return "Removal canceled"
 
     def delete(self, name):
-        if name in self.data:
-            del self.data[name]
+        if self._get(name) is not None:
+            del self[name]
         else:
             raise KeyError(f'{name} not found')
 
-    def iterator(self, n=4):
-        for i in range(0, len(self.data), n):
-            yield list(self.data.values())[i:i + n]
+    def iterator(self, n=4, keys=None, start=0):
+        """pages of up to n records following keys from index start on, keys deleted meanwhile
+        are left out; without keys the book is paged in the order records were added"""
+        data = self.data
+        if keys is None:
+            keys = list(data)
+        for i in range(start, len(keys), n):
+            yield [data[key] for key in keys[i:i + n] if key in data]
 
-    def save_to_disk(self, filename):
-        while not filename.strip():
-            filename = input("Enter a valid filename: ").strip()
+    def sorted_keys(self):
+        return sorted(self.data, key=lambda key: (key.casefold(), key))
 
+    def save_to_disk(self, filename):
+        """save the book to filename, False if it could not be written"""
+        if not filename.strip():
+            raise ValueError("Please enter the file to save to.")
         try:
-            with open(filename, 'wb+') as file:
-                data = [record.to_dict() for record in self.data.values()]
-                pickle.dump(data, file)
+            if self.journal is not None and self.journal.filename == f'{filename}.journal' and os.path.exists(filename):
+                self.journal.sync()
+                if self.journal.size > max(COMPACT_MIN_BYTES, os.path.getsize(filename) * COMPACT_RATIO):
+                    self.compact(filename)
+            else:
+                self.compact(filename)
         except FileNotFoundError:
             print(f"Error: The specified directory or file '{filename}' does not exist.")
+            return False
         except Exception as e:
             print(f"Error saving data to '{filename}': {str(e)}")
-
-    def load_from_disk(self, filename):
-        while not filename.strip():
-            filename = input("Enter a valid filename: ").strip()
+            return False
+        return True
+
+    def compact(self, filename):
+        """write a snapshot of the whole book and start an empty journal next to it"""
+        generation = self.generation + 1
+        records = (record.to_dict() for record in self.data.values())
+        storage.save_atomically(filename, lambda file: storage.write_records(file, records, generation))
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = journal.Journal(f'{filename}.journal', generation)
+        self.generation = generation
+
+    def load_from_disk(self, filename, lazy=False):
+        """replace the contacts with those saved in filename; lazy only opens a file saved with
+        a name index, records are read when they are looked up or the whole book is needed"""
+        if not filename.strip():
+            raise ValueError("Please enter the file to load.")
         try:
-            with open(filename, 'rb+') as file:
+            with open(filename, 'rb') as file:
                 print(f"\nReading data from {filename}")
-                data = pickle.load(file)
-                self.data.clear()
+                snapshot = None
+                if storage.is_binary(file):
+                    # saved by save_to_disk, already validated
+                    header = storage.read_header(file)
+                    generation = header[4]
+                    if lazy and header[5]:
+                        snapshot, data = storage.Snapshot(filename), ()
+                    else:
+                        data = storage.read_records(file, header)
+                else:
+                    # pickled list of dicts written by older versions, the next save converts it
+                    import pickle
+                    data, generation = pickle.load(file), None
+                    data = valid_legacy_records(data)
+                if self.journal is not None:
+                    self.journal.close()
+                    self.journal = None
+                self._clear()
+                self._snapshot = snapshot
                 for record_data in data:
-                    record = Record.from_dict(record_data)
-                    self.data[str(record.name)] = record
+                    record = Record.from_dict(record_data, validate=False)
+                    self[str(record.name)] = record
+            if generation is not None:
+                entries, valid = journal.read_journal(f'{filename}.journal', generation)
+                for operation, args in entries:
+                    self._replay(operation, args)
+                # a journal in the old format is left alone, the next save compacts the book
+                if valid is not None:
+                    self.journal = journal.Journal(f'{filename}.journal', generation, valid)
+                self.generation = generation
         except FileNotFoundError:
             print("File not found. Creating a new address book.")
         except Exception as e:
             print(f"Error loading data: {str(e)}")
 
-    def search_contacts(self, query):
-        results = []
-        query = query.lower()
-
-        for record in self.data.values():
-            if (
-                query in record.name.value.lower() or
-                any(query in phone.value for phone in record.phones)
-            ):
-                results.append(record)
-
-        return results
-    
+    def _replay(self, operation, args):
+        if operation == journal.ADD_RECORD:
+            record = Record.from_dict(args[0], validate=False)
+            self[str(record.name)] = record
+        elif operation == journal.CLEAR:
+            self._clear()
+        elif operation == journal.DELETE:
+            if self._get(args[0]) is not None:
+                del self[args[0]]
+        else:
+            record = self._get(args[0])
+            if record is None:
+                return
+            if operation == journal.ADD_PHONE:
+                record.add_phone(args[1])
+            elif operation == journal.REMOVE_PHONE:
+                record.remove_phone(args[1])
+            elif operation == journal.EDIT_PHONE:
+                record.edit_phone(args[1], args[2])
+            elif operation == journal.UPDATE_BIRTHDAY:
+                record.update_birthday(args[1])
+
+    def search_contacts(self, query, limit=None):
+        data = self.data
+        return [data[key] for key in self.search_keys(query, limit)]
+
+    def search_keys(self, query, limit=None):
+        return self.search_index.search(query, limit)
+
+    def similar_contacts(self, name, limit=5, transliterate=True):
+        """records with names a few typos away from name, nearest first"""
+        data = self.data
+        return [data[key] for key in self.similar_keys(name, limit, transliterate)]
+
+    def similar_keys(self, name, limit=5, transliterate=True, load=True):
+        """with transliterate, 'Олександр' and 'Olexandr' are close to 'Oleksandr'; without
+        load a lazily opened book is not read in full for the index, nothing is found then"""
+        if not load and self._fuzzy_index is None and self._snapshot is not None:
+            return []
+        return self.fuzzy_index.similar(name, limit, transliterate)
+
+    def upcoming_birthdays(self, days=7, today=None):
+        """(date, record) of contacts with a birthday in the next days, soonest first"""
+        import datetime
+        today = today or datetime.date.today()
+        data = self.data
+        return [(birthday, data[key]) for birthday, key in self.birthday_index.upcoming(days, today)]
+
+    def upcoming_keys(self, days=7, today=None):
+        import datetime
+        return [key for _, key in self.birthday_index.upcoming(days, today or datetime.date.today())]
@@ -0,0 +1,364 @@
+"""Address book kept in an SQLite database instead of memory
+
+SQLiteAddressBook has the API of AddressBook (add_record, find, delete,
+search_contacts, iterator, upcoming_birthdays, ...), but only the records in
+use are in memory: they are loaded on access and a few recently used ones are
+kept. The tables are
+
+    contacts  id, name, casefolded name, birthday, month * 100 + day of the birthday
+    phones    contact id, position in the record, phone
+
+with indexes on the casefolded name, the phone and the birthday's month and
+day. A Record loaded from the database notifies the book of changes like one
+in an AddressBook, and each change is one small statement.
+
+The database runs in WAL mode. Changes are committed every COMMIT_EVERY
+changes, on save_to_disk and on close, and bulk adds are one transaction.
+The SQL is fixed strings, so sqlite3 prepares every statement once and reuses
+it from its statement cache.
+"""
+import os
+import sqlite3
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import date
+
+import storage
+from birthdays import BirthdayIndex
+from classes import AddressBook, Record, merge_record
+from fuzzy import FuzzyIndex
+from search import EXACT_PHONE, EXACT_NAME, NAME_PREFIX, PHONE_PREFIX, NAME_SUBSTRING, PHONE_SUBSTRING
+
+COMMIT_EVERY = 1000
+CACHE_SIZE = 1024
+# names per 'IN (...)' when loading many records, below the smallest limit on parameters
+PARAMETERS = 500
+# rows per query when walking the whole book
+PAGE = 1000
+# sorts after every character, so [prefix, prefix + LAST) holds the strings starting with prefix
+LAST = '\U0010ffff'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    folded TEXT NOT NULL,
+    birthday TEXT,
+    month_day INTEGER
+);
+CREATE INDEX IF NOT EXISTS contacts_folded ON contacts (folded);
+CREATE INDEX IF NOT EXISTS contacts_month_day ON contacts (month_day, name);
+CREATE TABLE IF NOT EXISTS phones (
+    contact INTEGER NOT NULL REFERENCES contacts (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_contact ON phones (contact, position);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+"""
+
+CONTACT_ID = "SELECT id FROM contacts WHERE name = ?"
+UPSERT_CONTACT = """INSERT INTO contacts (name, folded, birthday, month_day) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET birthday = excluded.birthday, month_day = excluded.month_day
+    RETURNING id"""
+DELETE_CONTACT = "DELETE FROM contacts WHERE name = ?"
+UPDATE_BIRTHDAY = "UPDATE contacts SET birthday = ?, month_day = ? WHERE name = ?"
+DELETE_PHONES = "DELETE FROM phones WHERE contact = ?"
+INSERT_PHONE = "INSERT INTO phones (contact, position, phone) VALUES (?, ?, ?)"
+APPEND_PHONE = """INSERT INTO phones (contact, position, phone)
+    SELECT contacts.id, (SELECT COALESCE(MAX(position) + 1, 0) FROM phones WHERE contact = contacts.id), ?
+    FROM contacts WHERE name = ?"""
+REMOVE_PHONE = "DELETE FROM phones WHERE contact = (SELECT id FROM contacts WHERE name = ?) AND phone = ?"
+# Record.edit_phone changes the first phone that matches
+CHANGE_PHONE = """UPDATE phones SET phone = ? WHERE rowid = (
+    SELECT phones.rowid FROM phones JOIN contacts ON contacts.id = phones.contact
+    WHERE contacts.name = ? AND phones.phone = ? ORDER BY position LIMIT 1)"""
+FIND = "SELECT name FROM contacts WHERE folded = ? ORDER BY id LIMIT 1"
+COUNT = "SELECT COUNT(*) FROM contacts"
+NAMES_AFTER = "SELECT id, name FROM contacts WHERE id > ? ORDER BY id LIMIT ?"
+NAMES_IN_ORDER = "SELECT name FROM contacts ORDER BY id"
+SORTED_NAMES = "SELECT name FROM contacts ORDER BY folded, name"
+BIRTHDAYS_FROM = "SELECT month_day, name FROM contacts WHERE month_day >= ? ORDER BY month_day, name"
+# the ranks and their order are those of SearchIndex.search
+SEARCH = f"""
+SELECT contacts.name FROM (
+    SELECT contact AS id, {EXACT_PHONE} AS rank FROM phones WHERE phone = :query
+    UNION ALL SELECT id, {EXACT_NAME} FROM contacts WHERE folded = :query
+    UNION ALL SELECT id, {NAME_PREFIX} FROM contacts WHERE folded >= :query AND folded < :end
+    UNION ALL SELECT contact, {PHONE_PREFIX} FROM phones WHERE phone >= :query AND phone < :end
+    UNION ALL SELECT id, {NAME_SUBSTRING} FROM contacts WHERE instr(folded, :query)
+    UNION ALL SELECT contact, {PHONE_SUBSTRING} FROM phones WHERE instr(phone, :query)
+) AS matches JOIN contacts ON contacts.id = matches.id
+GROUP BY contacts.id ORDER BY MIN(rank), contacts.folded, contacts.name LIMIT :limit
+"""
+
+
+def month_day(record):
+    birthday = record.birthday_date()
+    return birthday.month * 100 + birthday.day if birthday is not None else None
+
+
+class BirthdayRows:
+    """the birthdays in the database as BirthdayIndex reads its sorted entries"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def iter_from(self, item):
+        """(month, day, name) of birthdays on or after the (month, day) item, in order"""
+        month, day = item[:2]
+        for value, name in self.connection.execute(BIRTHDAYS_FROM, (month * 100 + day,)):
+            yield value // 100, value % 100, name
+
+
+class SQLiteAddressBook(MutableMapping):
+
+    def __init__(self, filename, cache_size=CACHE_SIZE, commit_every=COMMIT_EVERY):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # with WAL a commit is safe against crashes of the process without an fsync
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.commit_every = commit_every
+        self.pending = 0
+        self.birthday_index = BirthdayIndex(BirthdayRows(self.connection))
+        # Record.find_phone looks for an in-memory index, there is none here
+        self._search_index = None
+        # names are few bytes each, 'did you mean' keeps them all in memory once asked
+        self._fuzzy_index = None
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def _changed(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def _remember(self, record):
+        key = str(record.name)
+        self.cache[key] = record
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    def _load(self, names):
+        """{name: Record} of the names found in the database"""
+        records = {}
+        missing = []
+        for name in names:
+            record = self.cache.get(name)
+            if record is None:
+                missing.append(name)
+            else:
+                records[name] = record
+        for i in range(0, len(missing), PARAMETERS):
+            chunk = missing[i:i + PARAMETERS]
+            marks = ', '.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT id, name, birthday FROM contacts WHERE name IN ({marks})", chunk).fetchall()
+            phones = {}
+            if rows:
+                marks = ', '.join('?' * len(rows))
+                for contact, phone in self.connection.execute(
+                        f"SELECT contact, phone FROM phones WHERE contact IN ({marks}) ORDER BY contact, position",
+                        [row[0] for row in rows]):
+                    phones.setdefault(contact, []).append(phone)
+            for contact, name, birthday in rows:
+                record = Record.from_dict({'name': name, 'phones': phones.get(contact, []), 'birthday': birthday},
+                                          validate=False)
+                record.book = self
+                records[name] = self._remember(record)
+        return records
+
+    def __getitem__(self, key):
+        record = self._load([key]).get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __contains__(self, key):
+        return key in self.cache or self.connection.execute(CONTACT_ID, (key,)).fetchone() is not None
+
+    def __setitem__(self, key, record):
+        birthday = record.birthday.value if record.birthday else None
+        (contact,) = self.connection.execute(UPSERT_CONTACT,
+                                             (key, key.casefold(), birthday, month_day(record))).fetchone()
+        self.connection.execute(DELETE_PHONES, (contact,))
+        self.connection.executemany(INSERT_PHONE, [(contact, position, phone)
+                                                   for position, phone in enumerate(record.phone_values)])
+        old = self.cache.get(key)
+        if old is not None and old is not record:
+            old.book = None
+        record.book = self
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.add(key)
+        self._remember(record)
+        self._changed()
+
+    def __delitem__(self, key):
+        if self.connection.execute(DELETE_CONTACT, (key,)).rowcount == 0:
+            raise KeyError(key)
+        record = self.cache.pop(key, None)
+        if record is not None:
+            record.book = None
+        if self._fuzzy_index is not None:
+            self._fuzzy_index.remove(key)
+        self._changed()
+
+    def __len__(self):
+        return self.connection.execute(COUNT).fetchone()[0]
+
+    def __iter__(self):
+        last = 0
+        while True:
+            rows = self.connection.execute(NAMES_AFTER, (last, PAGE)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            for _, name in rows:
+                yield name
+
+    def values(self):
+        """every record, loaded PAGE at a time"""
+        page = []
+        for name in self:
+            page.append(name)
+            if len(page) == PAGE:
+                yield from self._in_order(page)
+                page = []
+        yield from self._in_order(page)
+
+    def _in_order(self, names):
+        records = self._load(names)
+        return [records[name] for name in names if name in records]
+
+    def phone_added(self, record, phone):
+        self.connection.execute(APPEND_PHONE, (phone, str(record.name)))
+        self._changed()
+
+    def phone_removed(self, record, phone, count=1):
+        self.connection.execute(REMOVE_PHONE, (str(record.name), phone))
+        self._changed()
+
+    def phone_changed(self, record, old_phone, new_phone):
+        self.connection.execute(CHANGE_PHONE, (new_phone, str(record.name), old_phone))
+        self._changed()
+
+    def birthday_changed(self, record, old_birthday):
+        self.connection.execute(UPDATE_BIRTHDAY, (record.birthday.value, month_day(record), str(record.name)))
+        self._changed()
+
+    def _clear(self):
+        self.connection.execute("DELETE FROM phones")
+        self.connection.execute("DELETE FROM contacts")
+        for record in self.cache.values():
+            record.book = None
+        self.cache.clear()
+        self._fuzzy_index = None
+        self.commit()
+
+    def clear(self):
+        self._clear()
+
+    def _merge(self, obj):
+        """add a record or merge it into the contact with the same name, True if merged"""
+        return merge_record(self, obj, self.get(str(obj.name)))
+
+    add_record = AddressBook.add_record
+    clear_all_contacts = AddressBook.clear_all_contacts
+
+    def delete(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise KeyError(f'{name} not found') from None
+
+    def add_records(self, records):
+        """add or merge many records in one transaction, return (added, merged) counts"""
+        commit_every, self.commit_every = self.commit_every, float('inf')
+        try:
+            return AddressBook.add_records(self, records)
+        finally:
+            self.commit_every = commit_every
+            self.commit()
+
+    def find(self, name):
+        row = self.connection.execute(FIND, (name.casefold(),)).fetchone()
+        return self[row[0]] if row is not None else None
+
+    def iterator(self, n=4, keys=None, start=0):
+        """pages of up to n records following keys from index start on, keys deleted meanwhile
+        are left out; without keys the book is paged in the order records were added"""
+        if keys is None:
+            keys = [name for (name,) in self.connection.execute(NAMES_IN_ORDER)]
+        for i in range(start, len(keys), n):
+            yield self._in_order(keys[i:i + n])
+
+    def sorted_keys(self):
+        return [name for (name,) in self.connection.execute(SORTED_NAMES)]
+
+    def search_keys(self, query, limit=None):
+        query = query.casefold()
+        rows = self.connection.execute(SEARCH, {'query': query, 'end': query + LAST,
+                                                'limit': -1 if limit is None else limit})
+        return [name for (name,) in rows]
+
+    def search_contacts(self, query, limit=None):
+        return self._in_order(self.search_keys(query, limit))
+
+    def similar_keys(self, name, limit=5, transliterate=True, load=True):
+        """without load the names are not all read for the index, nothing is found until
+        a call with load has built it"""
+        if self._fuzzy_index is None:
+            if not load:
+                return []
+            self._fuzzy_index = FuzzyIndex()
+            for (key,) in self.connection.execute(NAMES_IN_ORDER):
+                self._fuzzy_index.add(key)
+        return self._fuzzy_index.similar(name, limit, transliterate)
+
+    def similar_contacts(self, name, limit=5, transliterate=True):
+        return self._in_order(self.similar_keys(name, limit, transliterate))
+
+    def upcoming_keys(self, days=7, today=None):
+        return [key for _, key in self.birthday_index.upcoming(days, today or date.today())]
+
+    def upcoming_birthdays(self, days=7, today=None):
+        """(date, record) of contacts with a birthday in the next days, soonest first"""
+        upcoming = list(self.birthday_index.upcoming(days, today or date.today()))
+        records = self._load([key for _, key in upcoming])
+        return [(birthday, records[key]) for birthday, key in upcoming]
+
+    def save_to_disk(self, filename):
+        """commit; saving to another file writes a snapshot AddressBook.load_from_disk reads,
+        False if it could not be written"""
+        try:
+            self.commit()
+            if os.path.abspath(filename) != os.path.abspath(self.filename):
+                records = (record.to_dict() for record in self.values())
+                storage.save_atomically(filename, lambda file: storage.write_records(file, records))
+        except Exception as e:
+            print(f"Error saving data to '{filename}': {str(e)}")
+            return False
+        return True
+
+    def load_from_disk(self, filename, lazy=False):
+        """replace the contacts with those of a file saved by AddressBook.save_to_disk;
+        the database is always read on demand, lazy changes nothing"""
+        if os.path.abspath(filename) == os.path.abspath(self.filename):
+            return
+        book = AddressBook()
+        book.load_from_disk(filename)
+        self._clear()
+        self.add_records(book.values())
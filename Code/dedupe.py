@@ -0,0 +1,153 @@
+"""Duplicate detection for sort.py --dedupe
+
+Files are compared in three steps and every step only runs for files the
+previous one could not tell apart: size, a hash of the first PARTIAL_SIZE
+bytes, and a hash of the whole content read through mmap in CHUNK_SIZE
+slices. Hashes are kept in a small SQLite cache keyed by (path, size, mtime),
+so files that did not change since the last run are not read again.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+
+PARTIAL_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def partial_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.blake2b(file.read(PARTIAL_SIZE), digest_size=16).digest()
+
+
+def full_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for start in range(0, len(view), CHUNK_SIZE):
+                    digest.update(view[start:start + CHUNK_SIZE])
+    return digest.digest()
+
+
+class HashCache:
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS hashes '
+                                '(path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, partial BLOB, full BLOB)')
+
+    def get(self, path, size, mtime):
+        row = self.connection.execute('SELECT size, mtime, partial, full FROM hashes WHERE path = ?', (path,)).fetchone()
+        if row is None or row[:2] != (size, mtime):
+            return None, None
+        return row[2], row[3]
+
+    def put(self, path, size, mtime, partial, full):
+        self.connection.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)', (path, size, mtime, partial, full))
+
+    def rename(self, path, new_path):
+        self.connection.execute('UPDATE OR REPLACE hashes SET path = ? WHERE path = ?', (new_path, path))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class Candidate:
+    """a file whose content other files are compared with
+
+    path is where the file can be read now, destination where it ends up once sorted"""
+
+    def __init__(self, path, size, mtime, destination=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.destination = destination or path
+        self.partial = None
+        self.full = None
+
+
+class Deduplicator:
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.by_size = {}
+        self.by_destination = {}
+        self.duplicates = 0
+        self.saved_bytes = 0
+
+    def _hashes(self, candidate, full):
+        if candidate.partial is None and self.cache is not None:
+            candidate.partial, candidate.full = self.cache.get(os.path.abspath(candidate.path), candidate.size, candidate.mtime)
+        if candidate.partial is None:
+            candidate.partial = partial_hash(candidate.path)
+            if candidate.size <= PARTIAL_SIZE:
+                candidate.full = candidate.partial
+            self._store(candidate)
+        if full and candidate.full is None:
+            candidate.full = full_hash(candidate.path)
+            self._store(candidate)
+        return candidate.partial, candidate.full
+
+    def _store(self, candidate):
+        if self.cache is not None:
+            self.cache.put(os.path.abspath(candidate.path), candidate.size, candidate.mtime, candidate.partial, candidate.full)
+
+    def discard(self, destination):
+        """forget the file at destination, something else is put there"""
+        replaced = self.by_destination.pop(destination, None)
+        if replaced is not None:
+            self.by_size[replaced.size].remove(replaced)
+
+    def add(self, candidate):
+        # a file sorted to the same place replaces the one that was there
+        self.discard(candidate.destination)
+        self.by_size.setdefault(candidate.size, []).append(candidate)
+        self.by_destination[candidate.destination] = candidate
+
+    def add_folder(self, folder):
+        """register the files already sorted into folder"""
+        stack = [folder]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    self.add(Candidate(entry.path, stat.st_size, stat.st_mtime_ns))
+
+    def find(self, candidate):
+        """a registered candidate with the same content, None when there is none"""
+        same_size = [other for other in self.by_size.get(candidate.size, ()) if other.destination != candidate.destination]
+        if not same_size:
+            return None
+        partial, _ = self._hashes(candidate, full=False)
+        same_start = [other for other in same_size if self._hashes(other, full=False)[0] == partial]
+        if not same_start:
+            return None
+        _, full = self._hashes(candidate, full=True)
+        for other in same_start:
+            if self._hashes(other, full=True)[1] == full:
+                self.duplicates += 1
+                self.saved_bytes += candidate.size
+                return other
+        return None
+
+    def moved(self, source, destination):
+        """the file registered for destination was moved there from source"""
+        candidate = self.by_destination.get(destination)
+        if candidate is None or candidate.path != source:
+            return
+        # a move keeps size and mtime, so cached hashes stay valid under the new path
+        if candidate.partial is not None and self.cache is not None:
+            self.cache.rename(os.path.abspath(source), os.path.abspath(destination))
+        candidate.path = destination
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,155 @@
+"""Typo-tolerant lookup of contact names, for 'did you mean' suggestions
+
+Every name is indexed by its Latin skeleton: casefolded, Cyrillic letters
+transliterated with the TRANS table of names.py, and a few spellings that
+transliterations disagree on folded together (x and ks, kh and h, j and y,
+...), so 'Olexandr', 'Oleksandr' and 'Олександр' share one skeleton.
+
+A query is matched by edit distance, counting a swap of two neighbouring
+letters as one edit, but only against candidates found through the padded
+trigrams of the skeletons. One edit changes at most four trigrams (a swap
+does), so a name within k edits of the query shares all but 4 * k of its
+trigrams: only the postings of the rarest 4 * k + 1 need to be read to find
+every such name, and the distance is computed only for those that share
+enough trigrams and are about as long, not for every contact. A term with no
+more than 4 * k trigrams may share none with a match, it is compared with
+every name of about its length instead. Without transliteration the distance
+is taken between the casefolded names themselves, so a name in the other
+alphabet is too far away to match; the trigrams of the skeletons say nothing
+about that distance, so every name is compared then.
+"""
+from names import TRANS
+from search import NGRAM, ngrams
+
+SUGGESTIONS = 5
+# most edits a match may be away unless asked for more, past it every name would be a candidate
+MAX_DISTANCE = 2
+# trigrams one edit can change
+CHANGED = NGRAM + 1
+
+# the Russian letters NAME_CHARS accepts and TRANS has no entry for
+LATIN = {**TRANS, ord('ы'): 'y', ord('э'): 'e', ord('ъ'): ''}
+# spellings transliterations differ on, in the order they are folded
+FOLDS = (('x', 'ks'), ('w', 'v'), ('ph', 'f'), ('kh', 'h'), ('j', 'y'))
+
+
+def skeleton(name):
+    """the Latin skeleton names are matched by"""
+    text = ' '.join(name.casefold().translate(LATIN).split())
+    for spelling, folded in FOLDS:
+        text = text.replace(spelling, folded)
+    return text
+
+
+def letters_apart(a, b):
+    """letters one of a and b has more of than the other, the larger count; no more than
+    their edit distance, and cheap enough to turn most names away before computing it"""
+    extra = 0
+    for char in set(b):
+        more = b.count(char) - a.count(char)
+        if more > 0:
+            extra += more
+    # b lacks as many of the letters of a, less what b is longer by
+    return max(extra, extra + len(a) - len(b))
+
+
+def distance(a, b, limit):
+    """edit distance of a and b, with insertions, deletions, substitutions and swaps
+    of neighbouring characters as one edit each; limit + 1 once it is over limit"""
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit or letters_apart(a, b) > limit:
+        return over
+    # only cells within limit of the diagonal can lead to a distance within limit,
+    # the others stay at over
+    before, previous = None, [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, char in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            other = b[j - 1]
+            value = previous[j - 1] if char == other else previous[j - 1] + 1
+            if previous[j] < value:
+                value = previous[j] + 1
+            if current[j - 1] < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other and before[j - 2] < value:
+                value = before[j - 2] + 1
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        before, previous = previous, current
+    return min(previous[-1], over)
+
+
+class FuzzyIndex:
+    """record keys by the skeleton of their name, and skeletons by their trigrams"""
+
+    def __init__(self):
+        self.keys = {}
+        self.grams = {}
+
+    def add(self, key):
+        """index key, adding it again changes nothing"""
+        term = skeleton(key)
+        keys = self.keys.get(term)
+        if keys is None:
+            self.keys[term] = {key}
+            for gram in ngrams(term):
+                self.grams.setdefault(gram, set()).add(term)
+        else:
+            keys.add(key)
+
+    def remove(self, key):
+        term = skeleton(key)
+        keys = self.keys.get(term)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self.keys[term]
+            for gram in ngrams(term):
+                terms = self.grams[gram]
+                terms.discard(term)
+                if not terms:
+                    del self.grams[gram]
+
+    def candidates(self, term, limit):
+        """skeletons that may be within limit edits of term"""
+        grams = ngrams(term)
+        # a match has at least `shared` of the grams, so it is in one of the rarest len - shared + 1
+        shared = len(grams) - CHANGED * limit
+        if shared < 1:
+            # a short term may share no trigram with a match, every name of about its length is one
+            return [candidate for candidate in self.keys if abs(len(candidate) - len(term)) <= limit]
+        rarest = sorted(grams, key=lambda gram: len(self.grams.get(gram, ())))
+        found = set()
+        for gram in rarest[:len(grams) - shared + 1]:
+            found.update(self.grams.get(gram, ()))
+        return [candidate for candidate in found
+                if abs(len(candidate) - len(term)) <= limit and len(grams & ngrams(candidate)) >= shared]
+
+    def similar(self, name, limit=SUGGESTIONS, transliterate=True, max_distance=None):
+        """keys of up to limit names closest to name, nearest first; by default a name may
+        be one edit away per four letters, at most MAX_DISTANCE, counted on the skeletons
+        when transliterating and on the casefolded names otherwise"""
+        term = skeleton(name) if transliterate else name.casefold()
+        if max_distance is None:
+            max_distance = min(MAX_DISTANCE, max(1, len(term) // 4))
+        found = []
+        if transliterate:
+            for candidate in self.candidates(term, max_distance):
+                edits = distance(term, candidate, max_distance)
+                if edits <= max_distance:
+                    found.extend((edits, key) for key in self.keys[candidate])
+        else:
+            for keys in self.keys.values():
+                for key in keys:
+                    edits = distance(term, key.casefold(), max_distance)
+                    if edits <= max_distance:
+                        found.append((edits, key))
+        found.sort(key=lambda item: (item[0], item[1].casefold(), item[1]))
+        return [key for _, key in found[:limit]]
@@ -0,0 +1,136 @@
+"""Append-only journal of address book changes
+
+A book saved with AddressBook.save_to_disk is a snapshot (see storage.py) plus
+a journal next to it, '<snapshot>.journal'. Every change to the book appends
+one small entry, kept in memory until the book is saved, so saving only has to
+write the entries made since the last save and changes that were never saved
+are dropped like before. Loading reads the snapshot and replays the journal on
+top of it.
+
+    header   magic, generation
+    entries  u32 payload length, u32 crc32 of the payload, payload:
+             u8 operation followed by its arguments
+
+Arguments are u16 length-prefixed utf-8 strings, except for ADD_RECORD which
+carries a record encoded by storage.encode_record. A crash in the middle of an
+append leaves a short or corrupt last entry, replay stops there and the entry
+is cut off before new ones are appended.
+
+Compaction writes a new snapshot with the next generation and starts an empty
+journal with that generation. A journal whose generation differs from the
+snapshot's is left over from before compaction and is ignored.
+
+Journals with LEGACY_MAGIC hold records in the layout of storage version 3.
+They are still replayed, but nothing is appended to them; the next save
+compacts the book instead.
+"""
+import os
+import struct
+import zlib
+
+import storage
+
+MAGIC = b'ABJR4'
+LEGACY_MAGIC = b'ABJRN'
+HEADER = struct.Struct('<5sI')
+ENTRY = struct.Struct('<II')
+STRING = struct.Struct('<H')
+
+ADD_RECORD, ADD_PHONE, EDIT_PHONE, REMOVE_PHONE, UPDATE_BIRTHDAY, DELETE, CLEAR = range(1, 8)
+
+
+def encode(operation, args):
+    if operation == ADD_RECORD:
+        return bytes((operation,)) + storage.encode_record(args[0])
+    parts = [bytes((operation,))]
+    for arg in args:
+        data = arg.encode()
+        parts.append(STRING.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def decode(payload, version=storage.VERSION):
+    """(operation, args) of an entry, ADD_RECORD records in the layout of the storage version"""
+    operation = payload[0]
+    if operation == ADD_RECORD:
+        return operation, (storage.unpack_record(payload[1:], version),)
+    args = []
+    position = 1
+    while position < len(payload):
+        length, = STRING.unpack_from(payload, position)
+        position += STRING.size
+        args.append(payload[position:position + length].decode())
+        position += length
+    return operation, tuple(args)
+
+
+def read_journal(filename, generation):
+    """return ([(operation, args)], length of the valid part) of a journal, an empty
+    list if it is missing or belongs to another generation; the length is None for a
+    legacy journal, which is read but must not be appended to"""
+    try:
+        file = open(filename, 'rb')
+    except FileNotFoundError:
+        return [], 0
+    with file:
+        header = file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return [], 0
+        magic, written_for = HEADER.unpack(header)
+        if magic not in (MAGIC, LEGACY_MAGIC) or written_for != generation:
+            return [], 0
+        version = storage.VERSION if magic == MAGIC else 3
+        entries = []
+        valid = HEADER.size
+        while True:
+            head = file.read(ENTRY.size)
+            if len(head) != ENTRY.size:
+                break
+            length, checksum = ENTRY.unpack(head)
+            payload = file.read(length)
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                break
+            entries.append(decode(payload, version))
+            valid += ENTRY.size + length
+        return entries, valid if magic == MAGIC else None
+
+
+class Journal:
+
+    def __init__(self, filename, generation, valid=0):
+        """open the journal for appending, keeping its first valid bytes
+        (as returned by read_journal) and starting a new one when there are none"""
+        self.filename = filename
+        self.generation = generation
+        if valid:
+            self.file = open(filename, 'r+b')
+            self.file.truncate(valid)
+            self.file.seek(valid)
+        else:
+            storage.save_atomically(filename, lambda file: file.write(HEADER.pack(MAGIC, generation)))
+            self.file = open(filename, 'r+b')
+            self.file.seek(0, 2)
+        self.size = self.file.tell()
+        # entries appended since the last sync, not in the file yet
+        self.pending = []
+
+    def append(self, operation, *args):
+        payload = encode(operation, args)
+        self.pending.append(ENTRY.pack(len(payload), zlib.crc32(payload)))
+        self.pending.append(payload)
+        self.size += ENTRY.size + len(payload)
+
+    def sync(self):
+        """write the pending entries and make them durable"""
+        if self.pending:
+            self.file.write(b''.join(self.pending))
+            self.pending = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """close the file, entries not synced are dropped"""
+        self.pending = []
+        self.size = self.file.tell()
+        self.file.close()
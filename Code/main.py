@@ -1,6 +1,29 @@
-from classes import *
+import os
+import sys
+
+from classes import AddressBook, Birthday, Name, Phone, Record
+from pager import Pager
+from router import Router
+import instrument
 
 address_book = AddressBook()
+# the file given with --book or --db, save and exit write to it without asking
+book_file = None
+# off in scripts: nothing may wait for input there, what a command needs is in its arguments
+interactive = True
+# on in a server: show() returns the pager and the server streams its pages to the client
+serving = False
+# a script saves the book after every this many changes, and at the end
+SAVE_EVERY = 1000
+OUTPUT_BUFFER = 1 << 16
+# commands that change the book
+MUTATIONS = {"add", "change phone", "birthday", "remove", "delete", "import", "clear all"}
+# a server runs these through its single writer, loading a book replaces all of it
+SERVER_WRITES = MUTATIONS | {"load"}
+# timed with --stats and --profile
+BOOK_METHODS = ('find', 'search_keys', 'upcoming_keys', 'similar_keys', 'save_to_disk', 'load_from_disk')
+# names offered when a contact is not found
+SUGGESTIONS = 3
 
 def input_error(func):
     def wrapper(*args, **kwargs):
@@ -14,7 +37,42 @@ def input_error(func):
             return "Invalid command format"
         except Exception as e:
             return f"Error: {str(e)}"
-    return wrapper
+    # commands that ask for input are timed with the wait
+    return instrument.timed(f"command.{func.__name__}", wrapper)
+
+def ask(prompt, missing):
+    if not interactive:
+        raise ValueError(missing)
+    return input(prompt).strip()
+
+def show(pager):
+    """browse the pages, in a script print them all, in a server leave them to the server"""
+    if interactive:
+        return pager.browse()
+    if serving:
+        return pager
+    for number in range(pager.pages - 1):
+        print(pager.page(number))
+    return pager.page(pager.pages - 1)
+
+def confined(filename):
+    """filename in a server resolved within the folder of the book, clients may not read or
+    write files anywhere else; unchanged outside a server"""
+    if not serving:
+        return filename
+    folder = os.path.realpath(os.path.dirname(book_file or '') or '.')
+    path = os.path.realpath(os.path.join(folder, filename))
+    if os.path.commonpath([folder, path]) != folder:
+        raise ValueError(f"The server only uses files in {folder}.")
+    return path
+
+def not_found(name):
+    """'Contact name not found.' with the names closest to it, if any are close; a book
+    opened lazily is not read in full for them, 'similar' does that"""
+    keys = address_book.similar_keys(name, SUGGESTIONS, load=False)
+    if not keys:
+        return f"Contact {name} not found."
+    return f"Contact {name} not found. Did you mean: {', '.join(keys)}?"
 
 def hello():
     return "Welcome to Your Address Book!\nType 'help' to see available commands and instructions."
@@ -26,20 +84,27 @@ def help():
         'add <name_contact> <another_phone>'                  - Add an additional phone number to an existing contact.
         'birthday <name_contact> <new_birthday_date>'         - Add or update the birthday of an existing contact.
         'change phone <name_contact> <old_phone> <new_phone>' - Change an existing phone number of a contact.
-        'search'                                              - Search for contacts by name or phone number that match the entered string.
+        'search <query>'                                      - Search for contacts by name or phone number that match the query.
+        'similar <name>'                                      - Show contacts with names a few typos away, in Latin or Cyrillic letters.
         'when <name_contact>'                                 - Show the number of days until the birthday for a contact.
-        'finde <name_contact>'                                - Show all phone numbers for a contact.
-        'show all'                                            - Display all contacts.
+        'upcoming <days>'                                     - Show contacts with a birthday in the next days (7 by default).
+        'finde <name_contact>' or 'find <name_contact>'       - Show all phone numbers for a contact.
+        'show all' or 'ls'                                    - Display all contacts.
         'remove <name_contact> <phone_number>'                - Remove a phone number from an existing contact.
         'delete <name_contact>'                               - Delete an entire contact.
-        'save'                                                - Save the address book to a file.
-        'load'                                                - Load the address book from a file.
-        'exit' or 'close' or 'good bye'                       - Exit the program.
-        'clear all'                                           - Clear all contacts."""
+        'import <file.csv|file.jsonl>'                        - Import contacts from a CSV or JSON Lines file.
+        'export <file.csv|file.jsonl>'                        - Export all contacts to a CSV or JSON Lines file.
+        'save <file>'                                         - Save the address book to a file, asks for it when not given.
+        'load <file>'                                         - Load the address book from a file, asks for it when not given.
+        'exit' or 'close' or 'good bye' or 'quit'             - Exit the program.
+        'stats'                                               - Show how long commands and address book calls took, with --stats or --profile.
+        'clear all <y>'                                       - Clear all contacts, asks for confirmation when 'y' is not given.\n
+    Press Tab to complete a command. 'main.py --script <file>' runs the commands in a file ('-' for stdin) without prompts,
+    'main.py --serve <host:port|socket>' serves them to many clients at once."""
 
 @input_error
 def add_contact(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) >= 2:
         name, phone = parts[0], parts[1]
         name_field = Name(name)
@@ -66,7 +131,7 @@ def add_contact(command):
 
 @input_error
 def change_contact(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 3:
         name, old_phone, new_phone = parts[0], parts[1], parts[2]
         record = address_book.find(name)
@@ -81,114 +146,142 @@ def change_contact(command):
 
 @input_error
 def get_phone(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 1:
         name = parts[0]
         record = address_book.find(name)
         if record:
-            phones_info = ', '.join(phone.value for phone in record.phones)
+            phones_info = ', '.join(record.phone_values)
             return f"Phone numbers for {name}: {phones_info}"
         else:
-            raise KeyError
+            return not_found(name)
     else:
         raise ValueError
 
-@input_error 
-def display_contacts_pagination(records, items_per_page=3):
-    total_pages = (len(records) + items_per_page - 1) // items_per_page
-
-    page = 1
-    while True:
-        start_index = (page - 1) * items_per_page
-        end_index = start_index + items_per_page
-        current_records = records[start_index:end_index]
-
-        if not current_records:
-            print("Contact list is empty")
-            break
-
-        result = f"Page {page}/{total_pages}:\n"
-        for record in current_records:
-            phones_info = ', '.join(phone.value for phone in record.phones)
-            result += f"{record.name.value}:\n  Phone numbers: {phones_info}\n  Birthday: {record.birthday}\n"
-
-        print(result)
+def format_contact(record):
+    phones_info = ', '.join(record.phone_values)
+    return f"{record.name.value}:\n  Phone numbers: {phones_info}\n  Birthday: {record.birthday}"
 
-        user_input = input("Type 'next' to view the next page, 'prev' for the previous page, or 'exit' to quit: ").strip().lower()
-
-        if user_input == 'next' and page < total_pages:
-            page += 1
-        elif user_input == 'prev' and page > 1:
-            page -= 1
-        elif user_input == 'exit':
-            break
-        else:
-            print("Invalid command. Please enter 'next', 'prev', or 'exit'.")
-
-    return "Showing contacts completed."
+def format_search_result(record):
+    phones_info = ', '.join(record.phone_values)
+    birthday_info = record.birthday if record.birthday else "None"
+    return f"Contact name: {record.name.value}\n  Phones: {phones_info}\n  Birthday: {birthday_info}"
 
 @input_error
 def show_all_contacts():
-    records = address_book.data.values()
-    if records:
-        result = "All contacts:\n"
-        for record in records:
-            phones_info = ', '.join(phone.value for phone in record.phones)
-            result += f"{record.name.value}:\n  Phone numbers: {phones_info}\n  Birthday: {record.birthday}\n"
-        return result
-    else:
+    if not address_book:
         return "Contact list is empty"
+    return show(Pager(address_book, address_book.sorted_keys(), format_contact, "All contacts"))
+
+@input_error
+def show_stats():
+    return instrument.report()
 
 def exit_bot():
     save_to_disk()
     return "Good bye!"
 
 @input_error
-def unknown_command(command):
+def unknown_command(command=''):
+    if not command:
+        return "Enter a command. Type 'help' for available commands."
     return f"Unknown command: {command}. Type 'help' for available commands."
 
 @input_error
-def save_to_disk():
-    filename = input("Enter the filename to save the address book: ").strip()
-    address_book.save_to_disk(filename)
+def save_to_disk(command=None):
+    filename = command or book_file or ask("Enter the filename to save the address book: ",
+                                           "Please enter the file to save to.")
+    filename = confined(filename)
+    if not address_book.save_to_disk(filename):
+        return f"Address book not saved to {filename}"
     return f"Address book saved to {filename}"
 
 @input_error
-def load_from_disk():
-    filename = input("Enter the filename to load/create the address book: : ").strip()
-    address_book.load_from_disk(filename)
+def load_from_disk(command=None):
+    filename = command or ask("Enter the filename to load/create the address book: : ",
+                              "Please enter the file to load.")
+    filename = confined(filename)
+    # contacts are read when a command needs them, startup does not wait for the whole book
+    address_book.load_from_disk(filename, lazy=True)
     return f"Address book loaded from {filename}"
 
 @input_error
-def search_contacts():
-    query = input("Enter the search query: ").strip()
-    results = address_book.search_contacts(query)
-
-    if results:
-        print(f"Search results for '{query}':")
-        for result in results:
-            phones_info = ', '.join(phone.value for phone in result.phones)
-            birthday_info = result.birthday if result.birthday else "None"
-            print(f"Contact name: {result.name.value}\n  Phones: {phones_info}\n  Birthday: {birthday_info}")
-    else:
-        print(f"No results found for '{query}'.")
+def search_contacts(command=None):
+    query = command if command is not None else ask("Enter the search query: ", "Please enter the search query.")
+    keys = address_book.search_keys(query)
+    if not keys:
+        return f"No results found for '{query}'."
+    return show(Pager(address_book, keys, format_search_result, f"Search results for '{query}'"))
+
+@input_error
+def similar_contacts(command=None):
+    name = command if command is not None else ask("Enter the name: ", "Please enter the name.")
+    keys = address_book.similar_keys(name, None)
+    if not keys:
+        return f"No contacts with names like '{name}'."
+    return show(Pager(address_book, keys, format_search_result, f"Contacts with names like '{name}'"))
+
+@input_error
+def clear_all_contacts(command=None):
+    answer = command or ask('Are you sure you want to delete all users? (y/n) ', "Please confirm with 'clear all y'.")
+    return address_book.clear_all_contacts(answer)
+
+@input_error
+def import_contacts(command):
+    if not command:
+        raise ValueError("Please enter the file to import.")
+    command = confined(command)
+    import transfer
+    report = transfer.import_contacts(address_book, command)
+    lines = [f"Imported {report['rows']} rows from {command} in {report['seconds']:.2f} s "
+             f"({report['rows'] / max(report['seconds'], 1e-9):.0f} rows/s): "
+             f"{report['added']} added, {report['merged']} merged, {report['rejected']} rejected."]
+    lines.extend(f"  {error}" for error in report['errors'])
+    return '\n'.join(lines)
+
+@input_error
+def export_contacts(command):
+    if not command:
+        raise ValueError("Please enter the file to export to.")
+    command = confined(command)
+    import transfer
+    report = transfer.export_contacts(address_book, command)
+    return (f"Exported {report['rows']} contacts to {command} in {report['seconds']:.2f} s "
+            f"({report['rows'] / max(report['seconds'], 1e-9):.0f} rows/s).")
 
 @input_error
 def when_birthday(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 1:
         name = parts[0]
         record = address_book.find(name)
         if record:
             return f"Days until birthday for {name}: {record.days_to_birthday()} days."
         else:
-            raise KeyError
+            return not_found(name)
     else:
         raise ValueError
 
+@input_error
+def upcoming_birthdays(command=None):
+    from datetime import date
+    from birthdays import next_birthday
+    days = int(command) if command else 7
+    if days < 0:
+        raise ValueError("Number of days must not be negative")
+    today = date.today()
+    keys = address_book.upcoming_keys(days, today)
+    if not keys:
+        return f"No birthdays in the next {days} days."
+
+    def format_birthday(record):
+        return f"  {next_birthday(record.birthday_date(), today).strftime('%d.%m')} - {record.name.value}"
+
+    return show(Pager(address_book, keys, format_birthday, f"Birthdays in the next {days} days"))
+
 @input_error
 def update_birthday(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 2:
         name, new_birthday = parts[0], parts[1]
         record = address_book.find(name)
@@ -202,7 +295,7 @@ def update_birthday(command):
 
 @input_error
 def remove_phone_from_contact(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 2:
         name, phone = parts[0], parts[1]
         record = address_book.find(name)
@@ -216,14 +309,14 @@ def remove_phone_from_contact(command):
 
 @input_error
 def delete_contact(command):
-    parts = command.split(" ")
+    parts = command.split()
     if len(parts) == 1:
         name = parts[0]
         try:
             address_book.delete(name)
             return f"Contact {name} deleted."
         except KeyError:
-            return f"Contact {name} not found."
+            return not_found(name)
     else:
         raise ValueError("Invalid command format for deleting a contact.")
 
@@ -235,36 +328,160 @@ commands = {
     "change phone": change_contact,
     "finde": get_phone,
     "when": when_birthday,
-    "birthday ": update_birthday,
+    "upcoming": upcoming_birthdays,
+    "birthday": update_birthday,
     "remove": remove_phone_from_contact,
     "delete": delete_contact,
     "show all": show_all_contacts,
+    "import": import_contacts,
+    "export": export_contacts,
     "save": save_to_disk,
     "load": load_from_disk,
     "search": search_contacts,
-    "clear all": address_book.clear_all_contacts,
+    "similar": similar_contacts,
+    "stats": show_stats,
+    "clear all": clear_all_contacts,
     "good bye": exit_bot,
     "close": exit_bot,
     "exit": exit_bot,
     ".": exit_bot,
 }
 
-def choice_action(data, commands):
-    for command in commands:
-        if data.startswith(command):
-            args = data[len(command):].strip()
-            return commands[command], args if args else None
-    return unknown_command, None
+aliases = {
+    "find": "finde",
+    "phone": "finde",
+    "ls": "show all",
+    "list": "show all",
+    "quit": "exit",
+    "bye": "exit",
+}
+
+router = Router(commands, aliases, unknown=unknown_command)
+
+def choice_action(data):
+    route = router.route(data)
+    return route.function, route.args
+
+def enable_completion():
+    try:
+        import readline
+    except ImportError:
+        # not on every platform, the bot works without completion
+        return
+    readline.set_completer(router.completer(readline.get_line_buffer))
+    readline.parse_and_bind("tab: complete")
+
+def run_script(lines, book_file=None, save_every=SAVE_EVERY):
+    """run commands from lines without prompts until the lines or an exit command end;
+    with book_file the book is saved there every save_every changes and at the end"""
+    global interactive
+    interactive = False
+    changes = 0
+    try:
+        for line in lines:
+            # the router ignores the case of command words, arguments like file names keep theirs
+            data = line.strip()
+            if not data or data.startswith('#'):
+                continue
+            route = router.route(data)
+            if route.function is exit_bot:
+                break
+            result = route.function(route.args) if route.args else route.function()
+            if result is not None:
+                print(result)
+            if book_file and route.name in MUTATIONS:
+                changes += 1
+                if save_every and changes % save_every == 0:
+                    address_book.save_to_disk(book_file)
+        if book_file:
+            address_book.save_to_disk(book_file)
+    finally:
+        interactive = True
+
+def run_batch(script, book_file=None, save_every=SAVE_EVERY):
+    """run_script on the file script, '-' for stdin, with output written in large blocks"""
+    stdout = sys.stdout
+    sys.stdout = open(stdout.fileno(), 'w', encoding='utf-8', buffering=OUTPUT_BUFFER, closefd=False)
+    try:
+        if book_file:
+            print(load_from_disk(book_file))
+        if script == '-':
+            run_script(sys.stdin, book_file, save_every)
+        else:
+            with open(script, encoding='utf-8') as lines:
+                run_script(lines, book_file, save_every)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def run_server(address, book_file=None):
+    """serve the commands to many clients at address until interrupted, see server.py"""
+    import server
+    global interactive, serving
+    interactive, serving = False, True
+    try:
+        if book_file:
+            print(load_from_disk(book_file))
+        served = server.run(address, router, address_book, book_file, SERVER_WRITES, exit_bot)
+        print(f"Applied {served.changed} changes in {served.batches} batches")
+    finally:
+        interactive, serving = True, False
+
+def parse_args(argv=None):
+    # argparse imports re, only the command line needs them
+    import argparse
+    parser = argparse.ArgumentParser(description="Address book assistant")
+    parser.add_argument('--script', metavar='FILE',
+                        help="run the commands in FILE, '-' for stdin, without prompts")
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help="serve the commands to many clients on a Unix socket (a path) or TCP (host:port)")
+    parser.add_argument('--book', metavar='FILE',
+                        help="address book to load at the start; a script or a server also saves it")
+    parser.add_argument('--db', metavar='FILE',
+                        help="keep the address book in the SQLite database FILE instead of memory")
+    parser.add_argument('--stats', action='store_true',
+                        help="time commands and address book calls, see the 'stats' command")
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                        help="like --stats, and run under cProfile; the profile is printed at the end, "
+                             "or written to FILE")
+    parser.add_argument('--save-every', type=int, default=SAVE_EVERY, metavar='N',
+                        help=f"in a script, also save after every N changes, 0 to save only at the end "
+                             f"(default {SAVE_EVERY})")
+    return parser.parse_args(argv)
 
 def main():
+    enable_completion()
     while True:
-        data = input("\nEnter command: ").lower().strip()
-        func, args = choice_action(data, commands)
+        data = input("\nEnter command: ").strip()
+        func, args = choice_action(data)
         result = func(args) if args else func()
         print(result)
         if result == "Good bye!":
             break
 
 if __name__ == "__main__":
-    load_from_disk()
-    main()
+    args = parse_args()
+    if args.db:
+        from database import SQLiteAddressBook
+        address_book = SQLiteAddressBook(args.db)
+    book_file = args.db or args.book
+    profiler = None
+    if args.stats or args.profile is not None:
+        instrument.enable()
+        instrument.wrap(type(address_book), BOOK_METHODS, 'book')
+    if args.profile is not None:
+        profiler = instrument.start_profile()
+    try:
+        if args.script is not None:
+            run_batch(args.script, book_file, args.save_every)
+        elif args.serve is not None:
+            run_server(args.serve, book_file)
+        else:
+            if not args.db:
+                load_from_disk(args.book)
+            main()
+    finally:
+        if instrument.enabled:
+            print(instrument.report())
+        if profiler is not None:
+            print(instrument.stop_profile(profiler, args.profile))
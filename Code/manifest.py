@@ -0,0 +1,98 @@
+"""State of the source folder after a sort, for sort.py --incremental
+
+Sorting moves files away, so what is left in the source after a run are the
+folders that still hold something and the files left in place (duplicates
+skipped by --dedupe skip, symlinks and special files). The manifest records
+these folders with their mtime, kept files with size and mtime, and the
+subfolders that survived. On the next run a folder whose mtime did not change
+has no new, removed or renamed entries, so it is not listed again; its kept
+files are carried over and only its recorded subfolders are visited. Files in
+changed folders are skipped when their size and mtime match the manifest.
+
+A file rewritten in place does not change the mtime of its folder, so in an
+unchanged folder it is picked up only once something else changes there.
+"""
+import json
+import os
+from collections import namedtuple
+
+from atomic import save_atomically
+
+VERSION = 1
+
+
+class KnownFolder(namedtuple('KnownFolder', 'name path symlink')):
+    """a subfolder of an unchanged folder, standing in for its os.DirEntry"""
+
+    def is_file(self):
+        return False
+
+    def is_dir(self):
+        return True
+
+    def is_symlink(self):
+        return self.symlink
+
+
+class Manifest:
+
+    def __init__(self, filename, root):
+        self.filename = filename
+        self.root = os.path.abspath(root)
+        try:
+            with open(filename, encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            data = {}
+        if data.get('version') != VERSION:
+            data = {'version': VERSION, 'roots': {}}
+        self.data = data
+        self.previous = data['roots'].get(self.root, {})
+        self.current = {}
+        self.skipped_folders = 0
+        self.skipped_files = 0
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root)
+
+    def folder(self, path):
+        """(state recorded for path or None, whether the folder is unchanged since)"""
+        state = self.previous.get(self._key(path))
+        if state is None:
+            return None, False
+        if os.stat(path).st_mtime_ns != state['mtime']:
+            return state, False
+        self.skipped_folders += 1
+        self.skipped_files += len(state['files'])
+        return state, True
+
+    def unchanged_file(self, state, entry):
+        """state of a file left in place last time and not changed since, else None"""
+        if entry.name not in state['files']:
+            return None
+        current = file_state(entry)
+        if current != state['files'][entry.name]:
+            return None
+        self.skipped_files += 1
+        return current
+
+    def keep(self, path, subfolders, files):
+        """record a folder that stays in the source, subfolders as [name, is symlink]
+        and files as {name: [size, mtime]}, None for special files"""
+        self.current[self._key(path)] = {'mtime': None, 'folders': subfolders, 'files': files}
+
+    def save(self):
+        # the mtime is taken after the run, moving files out and removing folders changes it
+        for key, state in self.current.items():
+            state['mtime'] = os.stat(os.path.join(self.root, key)).st_mtime_ns
+        self.data['roots'][self.root] = self.current
+        save_atomically(self.filename, lambda file: file.write(json.dumps(self.data).encode()))
+
+
+def known_folders(path, state):
+    return [KnownFolder(name, os.path.join(path, name), symlink) for name, symlink in state['folders']]
+
+
+def file_state(entry):
+    stat = entry.stat(follow_symlinks=False)
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,104 @@
+"""File names for sort.py: normalization and unique destinations
+
+normalize transliterates Cyrillic letters to Latin and replaces everything but
+letters, digits and '_' with '_'. The stem and the extension of a name are
+normalized apart, so 'a.b.c' keeps '.c' as its extension, a multi-part
+extension like 'tar.gz' keeps its dots, and a name without an extension gets
+none. Results are cached, sorting a tree meets the same names over and over.
+
+Destinations hands out names in the target folders. A name that is already
+there, on disk or given out before, gets _1, _2, ... added to its stem; the
+folder is listed once, and for every name the next number to try is kept, so
+many files with the same name do not make it quadratic.
+"""
+import os
+import re
+from functools import lru_cache
+
+# Transliterates the Cyrillic alphabet into Latin
+
+UKRAINIAN_SYMBOLS = 'абвгдеєжзиіїйклмнопрстуфхцчшщьюя'
+TRANSLATION = (
+    "a", "b", "v", "g", "d", "e", "je", "zh", "z", "y", "i", "ji", "j", "k", "l", "m", "n", "o", "p", "r", "s", "t",
+    "u",
+    "f", "h", "ts", "ch", "sh", "sch", "", "ju", "ja")
+
+TRANS = {}
+
+for key, value in zip(UKRAINIAN_SYMBOLS, TRANSLATION):
+    TRANS[ord(key)] = value
+    TRANS[ord(key.upper())] = value.upper()
+
+NOT_WORD = re.compile(r'\W')
+
+
+def split_name(name, extension=''):
+    """(stem, extension) of a file name; extension is a known, possibly multi-part
+    extension of the name, without it the part after the last dot is taken"""
+    if extension and len(name) > len(extension) + 1 and name[-len(extension) - 1:].lower() == '.' + extension:
+        return name[:-len(extension) - 1], name[-len(extension):]
+    stem, _, suffix = name.rpartition('.')
+    if not stem.strip('.'):
+        # no dot at all, or only the leading one of a hidden file
+        return name, ''
+    return stem, suffix
+
+
+def clean(text):
+    # translate is the slow part, most names have no Cyrillic letters to give it
+    if not text.isascii():
+        text = text.translate(TRANS)
+    return NOT_WORD.sub('_', text)
+
+
+@lru_cache(maxsize=1 << 16)
+def normalize_parts(name, extension=''):
+    """(normalized stem, normalized extension) of a file name"""
+    stem, suffix = split_name(name, extension)
+    if stem.startswith('.'):
+        hidden = len(stem) - len(stem.lstrip('.'))
+        stem = stem[:hidden] + clean(stem[hidden:])
+    else:
+        stem = clean(stem)
+    if suffix and not (suffix.isascii() and suffix.isalnum()):
+        suffix = '.'.join(clean(part) for part in suffix.split('.'))
+    return stem, suffix
+
+
+def join_name(stem, suffix):
+    return f'{stem}.{suffix}' if suffix else stem
+
+
+def normalize(name, extension=''):
+    return join_name(*normalize_parts(name, extension))
+
+
+class Destinations:
+
+    def __init__(self):
+        self.listings = {}
+        self.numbers = {}
+
+    def taken(self, folder):
+        names = self.listings.get(folder)
+        if names is None:
+            try:
+                names = set(os.listdir(folder))
+            except FileNotFoundError:
+                names = set()
+            self.listings[folder] = names
+        return names
+
+    def reserve(self, folder, stem, suffix=''):
+        """path of a name in folder nothing else has, made of stem and suffix"""
+        taken = self.taken(folder)
+        name = join_name(stem, suffix)
+        if name in taken:
+            key = (folder, name)
+            number = self.numbers.get(key, 0)
+            while name in taken:
+                number += 1
+                name = join_name(f'{stem}_{number}', suffix)
+            self.numbers[key] = number
+        taken.add(name)
+        return os.path.join(folder, name)
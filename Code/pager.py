@@ -0,0 +1,50 @@
+"""Paging through contacts one screen at a time
+
+A Pager keeps a snapshot of record keys in the order they are shown (sorted
+names for show all, best matches for search, soonest birthdays for upcoming)
+and renders one page only when it is asked for, through AddressBook.iterator.
+A page costs the same however big the book is; the snapshot holds keys, not
+records or text, and keys deleted after it was taken are skipped.
+"""
+PAGE_SIZE = 20
+PROMPT = "Type 'next' to view the next page, 'prev' for the previous page, or 'exit' to quit: "
+
+
+class Pager:
+
+    def __init__(self, book, keys, render, title, page_size=PAGE_SIZE):
+        self.book = book
+        self.keys = keys
+        self.render = render
+        self.title = title
+        self.page_size = page_size
+
+    @property
+    def pages(self):
+        return max(1, -(-len(self.keys) // self.page_size))
+
+    def page(self, number):
+        """text of page number, counted from 0"""
+        records = next(self.book.iterator(self.page_size, self.keys, number * self.page_size), [])
+        header = f"{self.title}:" if self.pages == 1 else f"{self.title} (page {number + 1}/{self.pages}):"
+        return '\n'.join([header] + [self.render(record) for record in records])
+
+    def browse(self, read=None, write=print):
+        """show pages until the user leaves; a single page is returned instead of shown"""
+        read = read or input
+        if self.pages == 1:
+            return self.page(0)
+        number = 0
+        write(self.page(number))
+        while True:
+            answer = read(PROMPT).strip().lower()
+            if answer == 'next' and number + 1 < self.pages:
+                number += 1
+            elif answer == 'prev' and number > 0:
+                number -= 1
+            elif answer in ('exit', ''):
+                return "Showing contacts completed."
+            else:
+                write("Invalid command. Please enter 'next', 'prev', or 'exit'.")
+                continue
+            write(self.page(number))
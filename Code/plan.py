@@ -0,0 +1,236 @@
+"""Plans of file operations for sort.py and their execution
+
+Sorter.plan scans the source folder once and returns a list of Operations;
+nothing on disk changes until the plan is executed, so it can be printed or
+exported first (sort.py --dry-run). The operations are
+
+    move     source to destination
+    link     a hard link to target, an already sorted file with the same content,
+             at destination, then remove source
+    extract  the archive source into the folder destination, or move it to
+             target when it cannot be extracted
+    keep     leave source where it is
+    remove   delete the folder source with everything in it
+    rmdir    remove the folder source, emptied by the operations before
+
+The executor runs a plan in batches of BATCH_SIZE. Before the first batch the
+plan is written to a progress log, and the number of operations done is
+appended after every batch; a run that stopped halfway is continued from there
+with sort.py --resume. Operations of the last unfinished batch that already
+happened are recognised by their source being gone.
+"""
+import errno
+import json
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import archive
+
+BATCH_SIZE = 1000
+PROGRESS_LOG = '.sort_progress.jsonl'
+
+Operation = namedtuple('Operation', 'action source destination target', defaults=(None, None))
+
+
+def move(source, destination):
+    # a rename is one system call; shutil.move checks the destination first and copies across file systems
+    try:
+        os.rename(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, destination)
+
+
+def link_file(source, original, destination):
+    """put a hard link to original, a file with the same content, at destination instead of moving source"""
+    temporary = destination + '.dedupe'
+    try:
+        os.link(original, temporary)
+    except OSError:
+        # no hard links across file systems or on this one, move the file after all
+        move(source, destination)
+        return
+    os.replace(temporary, destination)
+    os.remove(source)
+
+
+def extract_archive(item_path, archive_folder, destination):
+    """extract an archive and remove it, return (archive_folder, paths of the extracted files);
+    an archive that cannot be extracted is moved to destination as it is"""
+    try:
+        written = archive.extract(item_path, archive_folder)
+    except archive.ArchiveError as e:
+        print(f"Skipping {os.path.basename(item_path)}: {e}")
+        move(item_path, destination)
+        return archive_folder, []
+    os.remove(item_path)
+    return archive_folder, written
+
+
+def describe(operation):
+    action, source, destination, target = operation
+    if action == 'link':
+        return f"link {source} -> {destination} (same as {target})"
+    if action == 'extract':
+        return f"extract {source} -> {destination}/"
+    if destination is None:
+        return f"{action} {source}"
+    return f"{action} {source} -> {destination}"
+
+
+def run_sequence(operations):
+    return [function(*args) for function, args in operations]
+
+
+def group_operations(operations):
+    """split queued operations into sequences, operations sharing any key end up in one"""
+    parent = {}
+
+    def root(key):
+        while parent.setdefault(key, key) != key:
+            key = parent[key]
+        return key
+
+    for keys, _, _ in operations:
+        for key in keys[1:]:
+            parent[root(key)] = root(keys[0])
+    groups = {}
+    for keys, function, args in operations:
+        groups.setdefault(root(keys[0]), []).append((function, args))
+    return groups.values()
+
+
+def run_operations(operations, workers):
+    """run queued operations on a pool; operations on the same destination keep
+    their order and run one after another, so collisions resolve as in serial mode.
+    Returns what the archive extractions returned."""
+    moves, extractions = [], []
+    for sequence in group_operations(operations):
+        group = extractions if sequence[0][0] is extract_archive else moves
+        group.append(sequence)
+
+    with ThreadPoolExecutor(max_workers=workers) as threads, ProcessPoolExecutor(max_workers=workers) as processes:
+        futures = [threads.submit(run_sequence, sequence) for sequence in moves]
+        # decompression is CPU-bound, it gets processes instead of threads
+        extracted = [processes.submit(run_sequence, sequence) for sequence in extractions]
+        for future in futures:
+            future.result()
+        return [result for future in extracted for result in future.result()]
+
+
+class ProgressLog:
+    """a plan and how much of it is done: the plan on the first line, then one count per batch"""
+
+    def __init__(self, filename=PROGRESS_LOG):
+        self.filename = filename
+        self.file = None
+
+    def start(self, operations):
+        self.file = open(self.filename, 'w', encoding='utf-8')
+        self.file.write(json.dumps([list(operation) for operation in operations], ensure_ascii=False) + '\n')
+        self.sync()
+
+    def load(self):
+        """(operations, number done) of an unfinished plan, None when there is none"""
+        try:
+            with open(self.filename, encoding='utf-8') as file:
+                lines = file.read().split('\n')
+        except FileNotFoundError:
+            return None
+        try:
+            operations = [Operation(*operation) for operation in json.loads(lines[0])]
+        except (ValueError, TypeError):
+            return None
+        done = 0
+        # a crash may leave the last count cut short
+        for line in lines[1:]:
+            if line.isdigit():
+                done = int(line)
+        self.file = open(self.filename, 'a', encoding='utf-8')
+        return operations, done
+
+    def done(self, count):
+        self.file.write(f'{count}\n')
+        self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def finish(self):
+        self.file.close()
+        os.remove(self.filename)
+
+
+class Executor:
+    """applies plans; after_batch(batch, extracted) is called once a batch is done, with the
+    (archive folder, paths of the extracted files) of the extractions in it"""
+
+    def __init__(self, workers=1, batch_size=BATCH_SIZE, log=None, after_batch=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.log = log
+        self.after_batch = after_batch
+        self.created_directories = set()
+
+    def create_directory(self, path):
+        directory = os.path.dirname(path)
+        if directory and directory not in self.created_directories:
+            os.makedirs(directory, exist_ok=True)
+            self.created_directories.add(directory)
+
+    def call(self, operation):
+        """(keys, function, args) of an operation, None for one with nothing to do"""
+        action, source, destination, target = operation
+        if action == 'move':
+            return (destination,), move, (source, destination)
+        if action == 'link':
+            # the link needs the original in place, so it is ordered after the original's move
+            return (destination, target), link_file, (source, target, destination)
+        if action == 'extract':
+            return (destination, target), extract_archive, (source, destination, target)
+        if action == 'remove':
+            return (source,), shutil.rmtree, (source,)
+        if action == 'rmdir':
+            return (source,), os.rmdir, (source,)
+        return None
+
+    def run(self, operations, start=0, resuming=False):
+        """apply operations from start on; when resuming, skip those whose source is gone"""
+        if self.log is not None and not resuming:
+            self.log.start(operations)
+        for first in range(start, len(operations), self.batch_size):
+            batch = operations[first:first + self.batch_size]
+            if resuming:
+                batch = [operation for operation in batch if os.path.lexists(operation.source)]
+            self.run_batch(batch)
+            if self.log is not None:
+                self.log.done(first + self.batch_size)
+        if self.log is not None:
+            self.log.finish()
+
+    def run_batch(self, batch):
+        calls, folders = [], []
+        for operation in batch:
+            call = self.call(operation)
+            if call is None:
+                continue
+            if operation.action in ('remove', 'rmdir'):
+                folders.append(call)
+                continue
+            self.create_directory(operation.destination)
+            calls.append(call)
+
+        if self.workers > 1:
+            extracted = run_operations(calls, self.workers)
+        else:
+            extracted = [function(*args) for _, function, args in calls]
+            extracted = [result for (_, function, _), result in zip(calls, extracted) if function is extract_archive]
+        # folders go last, they are only empty once the files in them are moved
+        for _, function, args in folders:
+            function(*args)
+        if self.after_batch is not None:
+            self.after_batch(batch, extracted)
@@ -0,0 +1,128 @@
+"""Routing of command lines to the functions of main.py
+
+Command phrases of one or more words, like 'show all' or 'change phone', are
+kept in a trie of words. A line is split into words once, the trie is walked
+as far as the words go and the longest phrase that matched wins; whatever
+follows it, as typed, is the argument string. Matching ignores case and extra spaces,
+so 'birthday' no longer needs a trailing space to stay apart from other
+commands. Aliases are more phrases for the same command, and completion
+walks the same trie.
+"""
+from collections import namedtuple
+
+# name is the phrase the command was registered with, args the rest of the line or None,
+# words the same split into words
+Route = namedtuple('Route', 'name function args words')
+
+
+class Node:
+    __slots__ = ('children', 'name', 'function')
+
+    def __init__(self):
+        self.children = {}
+        self.name = None
+        self.function = None
+
+
+class Router:
+
+    def __init__(self, commands=None, aliases=None, unknown=None):
+        self.root = Node()
+        self.depth = 0
+        self.unknown = unknown
+        for phrase, function in (commands or {}).items():
+            self.add(phrase, function)
+        for alias, phrase in (aliases or {}).items():
+            self.alias(alias, phrase)
+
+    def _node(self, phrase):
+        words = phrase.lower().split()
+        if not words:
+            raise ValueError("A command needs at least one word")
+        node = self.root
+        for word in words:
+            node = node.children.setdefault(word, Node())
+        self.depth = max(self.depth, len(words))
+        return node
+
+    def add(self, phrase, function, name=None):
+        node = self._node(phrase)
+        node.name = name or ' '.join(phrase.lower().split())
+        node.function = function
+
+    def alias(self, alias, phrase):
+        """make alias run the command registered as phrase"""
+        target = self.find(phrase)
+        if target is None:
+            raise KeyError(f"Unknown command: {phrase}")
+        self.add(alias, target.function, target.name)
+
+    def find(self, phrase):
+        node = self.root
+        for word in phrase.lower().split():
+            node = node.children.get(word)
+            if node is None:
+                return None
+        return node if node.function is not None else None
+
+    def route(self, line):
+        """Route of the longest command phrase line starts with; an unknown command
+        routes to the unknown function with the whole line as its argument"""
+        # words past the deepest phrase are never looked at, they stay one string
+        parts = line.split(None, self.depth)
+        children, matched, used = self.root.children, None, 0
+        for word in parts[:self.depth]:
+            node = children.get(word) or children.get(word.lower())
+            if node is None:
+                break
+            used += 1
+            if node.function is not None:
+                matched, length = node, used
+            children = node.children
+        if matched is None:
+            line = line.strip()
+            return Route(None, self.unknown, line or None, tuple(line.split()))
+        if length == len(parts):
+            return Route(matched.name, matched.function, None, ())
+        # the rest of the line as typed, a file name may hold runs of spaces or tabs
+        args = line.lstrip()
+        for word in parts[:length]:
+            args = args[len(word):].lstrip()
+        args = args.rstrip()
+        return Route(matched.name, matched.function, args, tuple(args.split()))
+
+    def complete(self, line):
+        """command phrases that complete line, sorted"""
+        words = line.lower().split()
+        if line and not line[-1].isspace() and words:
+            partial = words.pop()
+        else:
+            partial = ''
+        node = self.root
+        for word in words:
+            node = node.children.get(word)
+            if node is None:
+                return []
+        prefix = ' '.join(words + [''])
+        found = []
+        stack = [(prefix + word, child) for word, child in node.children.items() if word.startswith(partial)]
+        while stack:
+            phrase, node = stack.pop()
+            if node.function is not None:
+                found.append(phrase)
+            stack.extend((f'{phrase} {word}', child) for word, child in node.children.items())
+        return sorted(found)
+
+    def completer(self, buffer):
+        """a readline completer; buffer returns the whole line typed so far"""
+        matches = []
+
+        def complete(text, state):
+            if state == 0:
+                line = buffer()
+                start = len(line) - len(text)
+                # readline replaces only the word being typed, so cut off what comes before it
+                matches[:] = [phrase[start:] for phrase in self.complete(line) if len(phrase) >= start]
+            return matches[state] if state < len(matches) else None
+
+        return complete
@@ -0,0 +1,188 @@
+from bisect import bisect_left, insort
+from heapq import nsmallest
+
+NGRAM = 3
+PAD = '\x00'
+CHUNK = 512
+
+# rank of a match, lower is better
+EXACT_PHONE, EXACT_NAME, NAME_PREFIX, PHONE_PREFIX, NAME_SUBSTRING, PHONE_SUBSTRING = range(6)
+
+
+def ngrams(term):
+    padded = f"{PAD}{term}{PAD}"
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+class SortedTerms:
+    """sorted strings kept in chunks of up to 2 * CHUNK items, so an insert or
+    removal shifts one chunk instead of the whole list"""
+
+    def __init__(self):
+        self.chunks = []
+        self.maxes = []
+
+    def clear(self):
+        self.chunks.clear()
+        self.maxes.clear()
+
+    def add(self, term):
+        if not self.chunks:
+            self.chunks.append([term])
+            self.maxes.append(term)
+            return
+        i = bisect_left(self.maxes, term)
+        if i == len(self.maxes):
+            i -= 1
+            self.chunks[i].append(term)
+            self.maxes[i] = term
+        else:
+            insort(self.chunks[i], term)
+        chunk = self.chunks[i]
+        if len(chunk) > 2 * CHUNK:
+            self.chunks[i:i + 1] = [chunk[:CHUNK], chunk[CHUNK:]]
+            self.maxes[i:i + 1] = [chunk[CHUNK - 1], chunk[-1]]
+
+    def remove(self, term):
+        i = bisect_left(self.maxes, term)
+        if i == len(self.maxes):
+            return
+        chunk = self.chunks[i]
+        j = bisect_left(chunk, term)
+        if chunk[j] != term:
+            return
+        del chunk[j]
+        if chunk:
+            self.maxes[i] = chunk[-1]
+        else:
+            del self.chunks[i]
+            del self.maxes[i]
+
+    def iter_from(self, item):
+        """items not less than item, in order"""
+        start = bisect_left(self.maxes, item)
+        for i in range(start, len(self.chunks)):
+            chunk = self.chunks[i]
+            for j in range(bisect_left(chunk, item) if i == start else 0, len(chunk)):
+                yield chunk[j]
+
+    def startswith(self, prefix):
+        for term in self.iter_from(prefix):
+            if not term.startswith(prefix):
+                return
+            yield term
+
+
+class SearchIndex:
+    """incremental indexes over contact names and phones
+
+    names and phones map a term to the keys of records holding it (repeated
+    once per occurrence), terms keeps the distinct terms sorted for prefix
+    search and grams maps a padded trigram to the terms containing it for
+    substring search."""
+
+    def __init__(self):
+        self.names = {}
+        self.phones = {}
+        self.terms = SortedTerms()
+        self.grams = {}
+
+    def clear(self):
+        self.names.clear()
+        self.phones.clear()
+        self.terms.clear()
+        self.grams.clear()
+
+    def _add(self, postings, term, key):
+        if term not in self.names and term not in self.phones:
+            self.terms.add(term)
+            for gram in ngrams(term):
+                terms = self.grams.get(gram)
+                if terms is None:
+                    self.grams[gram] = {term}
+                else:
+                    terms.add(term)
+        postings.setdefault(term, []).append(key)
+
+    def _remove(self, postings, term, key, count=1):
+        keys = postings.get(term)
+        if not keys:
+            return
+        for _ in range(count):
+            if key not in keys:
+                break
+            keys.remove(key)
+        if not keys:
+            del postings[term]
+        if term not in self.names and term not in self.phones:
+            self.terms.remove(term)
+            for gram in ngrams(term):
+                terms = self.grams[gram]
+                terms.discard(term)
+                if not terms:
+                    del self.grams[gram]
+
+    def add_name(self, key, name):
+        self._add(self.names, name.casefold(), key)
+
+    def remove_name(self, key, name):
+        self._remove(self.names, name.casefold(), key)
+
+    def add_phone(self, key, phone):
+        self._add(self.phones, phone, key)
+
+    def remove_phone(self, key, phone, count=1):
+        self._remove(self.phones, phone, key, count)
+
+    def add_record(self, key, record):
+        self.add_name(key, record.name.value)
+        for phone in record.phone_values:
+            self.add_phone(key, phone)
+
+    def remove_record(self, key, record):
+        self.remove_name(key, record.name.value)
+        for phone in record.phone_values:
+            self.remove_phone(key, phone)
+
+    def lookup_phone(self, phone):
+        return self.phones.get(phone, ())
+
+    def _containing(self, query):
+        if len(query) >= NGRAM:
+            postings = sorted((self.grams.get(query[i:i + NGRAM], ()) for i in range(len(query) - NGRAM + 1)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            # short queries: every term containing them has a padded trigram containing them
+            candidates = set()
+            for gram, terms in self.grams.items():
+                if query in gram:
+                    candidates.update(terms)
+        return (term for term in candidates if query in term)
+
+    def search(self, query, limit=None):
+        """record keys matching query by name or phone, best matches first"""
+        query = query.casefold()
+        ranks = {}
+
+        def rank(postings, term, value):
+            for key in postings.get(term, ()):
+                if value < ranks.get(key, PHONE_SUBSTRING + 1):
+                    ranks[key] = value
+
+        if not query:
+            for term in self.names:
+                rank(self.names, term, NAME_SUBSTRING)
+        else:
+            rank(self.phones, query, EXACT_PHONE)
+            rank(self.names, query, EXACT_NAME)
+            for term in self.terms.startswith(query):
+                rank(self.names, term, NAME_PREFIX)
+                rank(self.phones, term, PHONE_PREFIX)
+            for term in self._containing(query):
+                rank(self.names, term, NAME_SUBSTRING)
+                rank(self.phones, term, PHONE_SUBSTRING)
+
+        order = lambda key: (ranks[key], key.casefold(), key)
+        if limit is not None:
+            return nsmallest(limit, ranks, key=order)
+        return sorted(ranks, key=order)
@@ -0,0 +1,178 @@
+"""Serving one address book to many clients at once
+
+python main.py --serve ADDRESS [--book FILE] starts an asyncio server on a Unix
+socket (ADDRESS is its path) or on TCP (host:port, or :port for localhost).
+Clients speak the command language of main.py, one command per line, and may
+send the next one before the answer arrives. Every answer is the output of the
+command followed by a line holding a single dot; output lines that start with
+a dot get a second one, which clients strip, as in SMTP. The files named in
+save, load, import and export must be in the folder of the book.
+
+Commands that only read the book run as soon as they arrive, between those of
+other connections; listings are streamed a page at a time, so a long 'show all'
+does not hold the other clients up. Commands that change the book go to a
+single writer task, in the order they arrive. It applies every change waiting
+in its queue, saves the book once for the whole batch (with a journal that is
+one fsync) and only then answers, so a change that was answered is on disk.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import signal
+import stat
+from collections import namedtuple
+
+from pager import Pager
+
+# most changes the writer applies before it saves
+BATCH = 256
+END = b'.\n'
+
+Change = namedtuple('Change', 'route future')
+
+
+def parse_address(address):
+    """(host, port) of 'host:port' or ':port', the path of a Unix socket otherwise"""
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+def encode(text):
+    """lines of text with leading dots doubled, without the final dot"""
+    return ''.join(f'.{line}\n' if line.startswith('.') else f'{line}\n' for line in text.split('\n')).encode()
+
+
+def decode(lines):
+    """text of an answer from its lines, the final dot left out"""
+    return '\n'.join(line[1:] if line.startswith('.') else line for line in lines)
+
+
+def execute(route):
+    """run a routed command; what it prints comes before what it returns, and an error
+    it raises is the answer, neither the connection nor the writer ends with it"""
+    with contextlib.redirect_stdout(io.StringIO()) as printed:
+        try:
+            result = route.function(route.args) if route.args else route.function()
+        except Exception as e:
+            # commands outside input_error, 'help me' passes help an argument it does not take
+            result = f"Error: {e}"
+    printed = printed.getvalue().strip('\n')
+    if not printed:
+        return result
+    if isinstance(result, Pager):
+        return printed, result
+    return f'{printed}\n{result}' if result is not None else printed
+
+
+class Server:
+
+    def __init__(self, router, book, book_file=None, writes=(), exit_function=None, batch=BATCH):
+        self.router = router
+        self.book = book
+        self.book_file = book_file
+        # command names that change the book and go through the writer
+        self.writes = set(writes)
+        # the command that ends a connection
+        self.exit_function = exit_function
+        self.batch = batch
+        self.changes = asyncio.Queue()
+        self.batches = 0
+        self.changed = 0
+
+    async def writer(self):
+        while True:
+            batch = [await self.changes.get()]
+            while len(batch) < self.batch and not self.changes.empty():
+                batch.append(self.changes.get_nowait())
+            results = [execute(change.route) for change in batch]
+            if self.book_file:
+                self.book.save_to_disk(self.book_file)
+            self.batches += 1
+            self.changed += len(batch)
+            for change, result in zip(batch, results):
+                if not change.future.cancelled():
+                    change.future.set_result(result)
+
+    async def handle(self, reader, writer):
+        try:
+            async for line in reader:
+                route = self.router.route(line.decode('utf-8', 'replace').strip())
+                if route.function is self.exit_function:
+                    writer.write(encode("Good bye!") + END)
+                    break
+                if route.name in self.writes:
+                    future = asyncio.get_running_loop().create_future()
+                    self.changes.put_nowait(Change(route, future))
+                    result = await future
+                else:
+                    result = execute(route)
+                await self.answer(writer, result)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            # the client went away, or sent a line longer than the stream limit
+            pass
+        finally:
+            # not waiting for the close, a client that does not answer must not keep the handler
+            writer.close()
+
+    async def answer(self, writer, result):
+        if isinstance(result, tuple):
+            printed, result = result
+            writer.write(encode(printed))
+        if isinstance(result, Pager):
+            for number in range(result.pages):
+                writer.write(encode(result.page(number)))
+                # the other connections get their turn between pages
+                await writer.drain()
+        elif result is not None:
+            writer.write(encode(str(result)))
+        writer.write(END)
+        await writer.drain()
+
+    async def serve(self, address, ready=print):
+        target = parse_address(address)
+        if isinstance(target, tuple):
+            server = await asyncio.start_server(self.handle, *target)
+        else:
+            remove_socket(target)
+            server = await asyncio.start_unix_server(self.handle, target)
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            # not on Windows, Ctrl+C raises KeyboardInterrupt there and run() handles it
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(signum, stopped.set)
+        writer = asyncio.create_task(self.writer())
+        try:
+            async with server:
+                ready(f"Serving the address book on {address}, Ctrl+C to stop")
+                await stopped.wait()
+        finally:
+            writer.cancel()
+
+
+def remove_socket(path):
+    """remove a Unix socket left over by an earlier server, never any other file"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def run(address, router, book, book_file=None, writes=(), exit_function=None, batch=BATCH):
+    """serve until interrupted or terminated, then save the book"""
+    server = Server(router, book, book_file, writes, exit_function, batch)
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if book_file:
+            book.save_to_disk(book_file)
+        if not isinstance(parse_address(address), tuple):
+            remove_socket(address)
+    return server
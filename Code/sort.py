@@ -1,167 +1,377 @@
+import argparse
 import os
-import shutil
-import zipfile
-import re
-import sys
-
-# Transliterates the Cyrillic alphabet into Latin
-
-UKRAINIAN_SYMBOLS = 'абвгдеєжзиіїйклмнопрстуфхцчшщьюя'
-TRANSLATION = (
-    "a", "b", "v", "g", "d", "e", "je", "zh", "z", "y", "i", "ji", "j", "k", "l", "m", "n", "o", "p", "r", "s", "t",
-    "u",
-    "f", "h", "ts", "ch", "sh", "sch", "", "ju", "ja")
-
-TRANS = {}
-
-for key, value in zip(UKRAINIAN_SYMBOLS, TRANSLATION):
-    TRANS[ord(key)] = value
-    TRANS[ord(key.upper())] = value.upper()
-
-
-def normalize(name):
-    name, *extension = name.split('.')
-    new_name = name.translate(TRANS)
-    new_name = re.sub(r'\W', "_", new_name)
-    return f"{new_name}.{'.'.join(extension)}"
-
-
-images_files = list()
-video_files = list()
-doc_files = list()
-audio_files = list()
-archives = list()
-folders = list()
-others = list()
-known_extensions = set()
-unknown_extensions = set()
-
-
-def create_directory(directory_path):
-    os.makedirs(directory_path, exist_ok=True)
-
-
-def process_image(item, item_path, normalized_item):
-    create_directory('images')
-    images_files.append(item)
-    known_extensions.add('image')
-    shutil.move(item_path, os.path.join('images', normalized_item))
-
-
-def process_video(item, item_path, normalized_item):
-    create_directory('video')
-    video_files.append(item)
-    known_extensions.add('video')
-    shutil.move(item_path, os.path.join('video', normalized_item))
-
-
-def process_document(item, item_path, normalized_item):
-    create_directory('documents')
-    doc_files.append(item)
-    known_extensions.add('document')
-    shutil.move(item_path, os.path.join('documents', normalized_item))
-
-
-def process_audio(item, item_path, normalized_item):
-    create_directory('audio')
-    audio_files.append(item)
-    known_extensions.add('audio')
-    shutil.move(item_path, os.path.join('audio', normalized_item))
-
-
-def process_archive(item, item_path, normalized_item):
-    create_directory('archives')
-    archives.append(item)
-    known_extensions.add('archive')
-    archive_folder = os.path.join('archives', normalized_item.rsplit('.', 1)[0])
-    if zipfile.is_zipfile(item_path):
-        with zipfile.ZipFile(item_path, 'r') as zip_ref:
-            zip_ref.extractall(archive_folder)
-    else:
-        print(f"Skipping {item}: Not a valid zip file")
-    os.remove(item_path)
-
-
-def process_other(item, item_path, normalized_item):
-    create_directory('others')
-    unknown_extensions.add('other')
-    others.append(item)
-    shutil.move(item_path, os.path.join('others', normalized_item))
-
-
-def process_folder(folder):
-    for item in os.listdir(folder):
-        item_path = os.path.join(folder, item)
-        normalized_item = normalize(item)
-
-        if os.path.isfile(item_path):
-            extension = item.split('.')[-1].lower()
-
-            processors = {
-                'jpeg': process_image,
-                'png': process_image,
-                'jpg': process_image,
-                'svg': process_image,
-                'avi': process_video,
-                'mp4': process_video,
-                'mov': process_video,
-                'mkv': process_video,
-                'doc': process_document,
-                'docx': process_document,
-                'txt': process_document,
-                'pdf': process_document,
-                'xlsx': process_document,
-                'pptx': process_document,
-                'mp3': process_audio,
-                'ogg': process_audio,
-                'wav': process_audio,
-                'amr': process_audio,
-                'zip': process_archive,
-                'gz': process_archive,
-                'tar': process_archive
-            }
-
-            processor = processors.get(extension, process_other)
-            processor(item, item_path, normalized_item)
-
-        elif os.path.isdir(item_path):
-            # Recursively process nested folders
-            if item not in ('images', 'video', 'documents', 'audio', 'archives', 'others'):
-                process_folder(item_path)
-                folders.append(item)
-            else:
-                shutil.rmtree(item_path)
+import json
+import time
+from operator import attrgetter
+
+import instrument
+import plan
+from categories import OTHERS, Registry, load_registry
+from dedupe import Candidate, Deduplicator, HashCache
+from manifest import Manifest, file_state, known_folders
+from names import Destinations, normalize_parts
+from plan import PROGRESS_LOG, Executor, Operation, ProgressLog, describe
+
+DEFAULT_REGISTRY = Registry()
+HASH_CACHE = '.sort_hashes.sqlite'
+MANIFEST = '.sort_manifest.json'
+
+
+class Folder:
+    """a folder on the scan_tree stack"""
+    __slots__ = ('path', 'entries', 'remaining', 'removable', 'files', 'subfolders', 'previous')
+
+    def __init__(self, path, removable, manifest):
+        self.path = path
+        self.removable = removable
+        # entries staying in the folder, and with --incremental their manifest state
+        self.remaining = 0
+        self.files = {}
+        self.subfolders = []
+        self.previous = None
+        if manifest is not None:
+            self.previous, unchanged = manifest.folder(path)
+            if unchanged:
+                self.entries = iter(known_folders(path, self.previous))
+                self.files = dict(self.previous['files'])
+                self.remaining = len(self.files)
+                self.previous = None
+                return
+        # sorted, so the same tree always gets the same plan and the same _1, _2 names
+        self.entries = iter(sorted(os.scandir(path), key=attrgetter('name')))
+
+
+class SortResult:
+    """what one sort did: names of the files of every category, the kinds of files seen,
+    the folders walked, the plan, and what --dedupe, --incremental and the timer counted"""
+
+    def __init__(self, registry):
+        self.files = {category.name: [] for category in registry.categories}
+        self.files[OTHERS.name] = []
+        self.known_extensions = set()
+        self.unknown_extensions = set()
+        self.folders = []
+        self.duplicates = 0
+        self.duplicate_bytes = 0
+        self.unchanged_folders = 0
+        self.unchanged_files = 0
+        self.timings = {}
+        self.operations = []
+
+    def add(self, category, item):
+        self.files[category.name].append(item)
+        if category is OTHERS:
+            self.unknown_extensions.add(category.kind)
         else:
-            # We ignore symbolic links and other special files
-            continue
-
-
-def remove_empty_folders(path):
-    for root, dirs, files in os.walk(path, topdown=False):
-        for folder in dirs:
-            folder_path = os.path.join(root, folder)
-            if not os.listdir(folder_path):
-                os.rmdir(folder_path)
+            self.known_extensions.add(category.kind)
+
+
+class Sorter:
+    """one sort of a folder into category folders in the current directory
+
+    All options and all state of the run live here, not in the module, so several
+    sorts can run in one process. The folder is scanned once into a plan (see
+    plan.py) and nothing changes on disk before the plan is executed. workers > 1
+    moves files and extracts archives on pools; dedupe is 'link' or 'skip' for files
+    whose content is sorted already; incremental skips what did not change since
+    the last run; sort_archives sorts extracted files into the category folders;
+    sniff classifies files without a known extension by their first bytes.
+    """
+
+    def __init__(self, registry=None, workers=1, dedupe=None, hash_cache=HASH_CACHE,
+                 incremental=False, manifest=MANIFEST, sort_archives=False, sniff=False,
+                 progress_log=PROGRESS_LOG):
+        self.registry = registry or DEFAULT_REGISTRY
+        self.target_folders = set(self.registry.folders)
+        self.workers = workers
+        self.dedupe_mode = dedupe
+        self.hash_cache = hash_cache
+        self.incremental = incremental
+        self.manifest_file = manifest
+        self.sort_archives = sort_archives
+        self.sniff = sniff
+        self.progress_log = progress_log
+        self.result = SortResult(self.registry)
+        self.operations = []
+        self.destinations = Destinations()
+        self.deduplicator = None
+        self.manifest = None
+
+    def run(self, folder, dry_run=False):
+        """sort the files below folder, return the SortResult; a dry run only plans"""
+        timings = self.result.timings
+        start = time.perf_counter()
+        if self.dedupe_mode:
+            self.deduplicator = Deduplicator(HashCache(self.hash_cache))
+            for target in self.registry.folders:
+                self.deduplicator.add_folder(target)
+        if self.incremental:
+            self.manifest = Manifest(self.manifest_file, folder)
+        timings['setup'] = time.perf_counter() - start
+
+        stage = time.perf_counter()
+        self.result.operations = self.plan(folder)
+        timings['scan'] = time.perf_counter() - stage
+
+        if not dry_run:
+            stage = time.perf_counter()
+            self.executor(ProgressLog(self.progress_log)).run(self.result.operations)
+            timings['execute'] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        if self.manifest is not None:
+            if not dry_run:
+                self.manifest.save()
+            self.result.unchanged_folders = self.manifest.skipped_folders
+            self.result.unchanged_files = self.manifest.skipped_files
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+            self.result.duplicates = self.deduplicator.duplicates
+            self.result.duplicate_bytes = self.deduplicator.saved_bytes
+        timings['cleanup'] = time.perf_counter() - stage
+        timings['total'] = time.perf_counter() - start
+        if instrument.enabled:
+            for name, seconds in timings.items():
+                instrument.record(f'sort.{name}', seconds)
+        return self.result
+
+    def resume(self):
+        """finish the plan of a run that stopped halfway, return the SortResult, None when there is no such plan"""
+        log = ProgressLog(self.progress_log)
+        loaded = log.load()
+        if loaded is None:
+            return None
+        start = time.perf_counter()
+        self.result.operations, done = loaded
+        self.executor(log).run(self.result.operations, start=done, resuming=True)
+        self.result.timings['execute'] = time.perf_counter() - start
+        return self.result
+
+    def executor(self, log):
+        return Executor(self.workers, log=log, after_batch=self.after_batch)
+
+    def after_batch(self, batch, extracted):
+        if self.deduplicator is not None:
+            for operation in batch:
+                if operation.action == 'move':
+                    self.deduplicator.moved(operation.source, operation.destination)
+        if self.sort_archives:
+            for archive_folder, written in extracted:
+                self.sort_extracted(archive_folder, written)
+
+    def plan_move(self, source, folder, stem, suffix):
+        """plan moving source into folder under a unique name made of stem and suffix or,
+        for a duplicate, linking or keeping it; return True if the file stays where it is"""
+        candidate = original = None
+        if self.deduplicator is not None:
+            stat = os.stat(source)
+            candidate = Candidate(source, stat.st_size, stat.st_mtime_ns)
+            original = self.deduplicator.find(candidate)
+            if original is not None and self.dedupe_mode == 'skip':
+                self.operations.append(Operation('keep', source))
+                return True
+
+        destination = self.destinations.reserve(folder, stem, suffix)
+        if original is not None:
+            self.operations.append(Operation('link', source, destination, original.destination))
+            return False
+        if candidate is not None:
+            candidate.destination = destination
+            self.deduplicator.add(candidate)
+        self.operations.append(Operation('move', source, destination))
+        return False
+
+    def classify(self, item, item_path):
+        """(category, matched extension) of a file"""
+        category, extension = self.registry.match(item)
+        if category is None and self.sniff:
+            category = self.registry.sniff(item_path)
+        return category or OTHERS, extension
+
+    def sort_file(self, item, item_path, category, extension):
+        """plan moving a file to the folder of its category or extracting it there,
+        return True if it stays where it is"""
+        self.result.add(category, item)
+        stem, suffix = normalize_parts(item, extension)
+        if category.extract:
+            archive_folder = self.destinations.reserve(category.folder, stem)
+            destination = self.destinations.reserve(category.folder, stem, suffix)
+            self.operations.append(Operation('extract', item_path, archive_folder, destination))
+            return False
+        return self.plan_move(item_path, category.folder, stem, suffix)
+
+    def sort_extracted(self, archive_folder, written):
+        """move extracted files on to their category folders, archives inside archives stay unpacked"""
+        operations, self.operations = self.operations, []
+        try:
+            for path in written:
+                item = os.path.basename(path)
+                category, extension = self.classify(item, path)
+                if not category.extract:
+                    self.sort_file(item, path, category, extension)
+            members = self.operations
+        finally:
+            self.operations = operations
+        Executor(after_batch=self.after_batch).run_batch(members)
+        # the folders they leave empty are known without walking the archive folder again
+        stop = os.path.dirname(archive_folder)
+        for directory in sorted({os.path.dirname(path) for path in written}, key=len, reverse=True):
+            while directory != stop:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+    def scan_tree(self, folder, empty_folders):
+        """yield the DirEntry of every file below folder, in the order of a recursive listing
+
+        Every folder is listed once with os.scandir and the walk keeps an explicit stack,
+        so deep trees do not hit the recursion limit. The caller is expected to move away
+        every file it gets, or send True for a file it leaves in place; folders that are
+        left empty are appended to empty_folders, deepest first, so they can be removed
+        without walking the tree again. With a manifest, folders and files it knows as
+        unchanged are not listed or yielded again, and the folders that stay are recorded.
+        """
+        manifest = self.manifest
+        stack = [Folder(folder, False, manifest)]
+        while stack:
+            frame = stack[-1]
+            for entry in frame.entries:
+                if entry.is_file():
+                    if frame.previous is not None:
+                        state = manifest.unchanged_file(frame.previous, entry)
+                        if state is not None:
+                            frame.remaining += 1
+                            frame.files[entry.name] = state
+                            continue
+                    if (yield entry):
+                        frame.remaining += 1
+                        if manifest is not None:
+                            frame.files[entry.name] = file_state(entry)
+                elif entry.is_dir():
+                    if entry.name in self.target_folders:
+                        self.operations.append(Operation('remove', entry.path))
+                        continue
+                    # a symlinked folder is sorted like any other, but the link itself stays
+                    stack.append(Folder(entry.path, not entry.is_symlink(), manifest))
+                    break
+                else:
+                    # We ignore symbolic links and other special files
+                    frame.remaining += 1
+                    frame.files[entry.name] = None
+            else:
+                stack.pop()
+                if frame.path != folder:
+                    self.result.folders.append(os.path.basename(frame.path))
+                if frame.removable and not frame.remaining:
+                    empty_folders.append(frame.path)
+                    continue
+                if manifest is not None:
+                    manifest.keep(frame.path, frame.subfolders, frame.files)
+                if stack:
+                    stack[-1].remaining += 1
+                    stack[-1].subfolders.append([os.path.basename(frame.path), not frame.removable])
+
+    def plan(self, folder):
+        """scan folder once and return the operations that sort it, nothing on disk is changed"""
+        self.operations = []
+        empty_folders = []
+        walker = self.scan_tree(folder, empty_folders)
+        kept = None
+        while True:
+            try:
+                entry = walker.send(kept)
+            except StopIteration:
+                break
+            category, extension = self.classify(entry.name, entry.path)
+            kept = self.sort_file(entry.name, entry.path, category, extension)
+        self.operations.extend(Operation('rmdir', path) for path in empty_folders)
+        return self.operations
 
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: sort <source_folder>")
-        sys.exit(1)
-
-    source_folder = sys.argv[1]
-
-    process_folder(source_folder)
-    remove_empty_folders(source_folder)
-
-    print(f"\nImages: {images_files}\n")
-    print(f"Video: {video_files}\n")
-    print(f"Documents: {doc_files}\n")
-    print(f"Audio: {audio_files}\n")
-    print(f"Archives: {archives}\n")
-    print(f"Unknown Extensions: {unknown_extensions}\n")
-    print(f"Others: {others}\n")
-    print(f"Known Extensions: {known_extensions}\n")
+    parser = argparse.ArgumentParser(prog='sort', description='Sort the files of a folder by type.')
+    parser.add_argument('source_folder', nargs='?')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='scan the tree first, then move files and extract archives with N workers')
+    parser.add_argument('--dedupe', choices=('link', 'skip'),
+                        help='hard link files whose content is already sorted, or leave them in place')
+    parser.add_argument('--hash-cache', default=HASH_CACHE, metavar='FILE',
+                        help='where --dedupe keeps file hashes between runs')
+    parser.add_argument('--sort-archives', action='store_true',
+                        help='move the files extracted from archives to their category folders')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip folders and files that did not change since the last run')
+    parser.add_argument('--manifest', default=MANIFEST, metavar='FILE',
+                        help='where --incremental keeps the state of the source folder')
+    parser.add_argument('--config', metavar='FILE',
+                        help='JSON file with more categories and extensions')
+    parser.add_argument('--sniff', action='store_true',
+                        help='recognise files without a known extension by their first bytes')
+    parser.add_argument('--dry-run', nargs='?', const='text', choices=('text', 'json'), metavar='FORMAT',
+                        help='only print the plan, as text or json, without changing anything')
+    parser.add_argument('--resume', action='store_true',
+                        help='finish the plan of a run that was interrupted')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE',
+                        help='time the stages and file operations and run under cProfile; '
+                             'the profile is printed at the end, or written to FILE')
+    args = parser.parse_args()
+    if args.source_folder is None and not args.resume:
+        parser.error("the source folder is required")
+
+    try:
+        registry = load_registry(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot load the config: {e}")
+    if args.profile is None:
+        sort_folder(args, registry)
+        return
+    instrument.enable()
+    # operations run in worker processes with --workers are not timed
+    instrument.wrap(plan, ('move', 'link_file', 'extract_archive'), 'sort')
+    profiler = instrument.start_profile()
+    try:
+        sort_folder(args, registry)
+    finally:
+        print(instrument.report())
+        print(instrument.stop_profile(profiler, args.profile))
+
+
+def sort_folder(args, registry):
+    sorter = Sorter(registry, workers=args.workers, dedupe=args.dedupe, hash_cache=args.hash_cache,
+                    incremental=args.incremental, manifest=args.manifest,
+                    sort_archives=args.sort_archives, sniff=args.sniff)
+    if args.resume:
+        result = sorter.resume()
+        if result is None:
+            print("There is no interrupted sort to resume")
+            return
+        print(f"Finished {len(result.operations)} planned operations in {result.timings['execute']:.3f} s")
+        return
+    result = sorter.run(args.source_folder, dry_run=args.dry_run is not None)
+    if args.dry_run == 'json':
+        print(json.dumps([operation._asdict() for operation in result.operations], ensure_ascii=False, indent=1))
+        return
+    if args.dry_run:
+        for operation in result.operations:
+            print(describe(operation))
+
+    print()
+    for category in registry.categories:
+        print(f"{category.title}: {result.files[category.name]}\n")
+    print(f"Unknown Extensions: {result.unknown_extensions}\n")
+    print(f"Others: {result.files[OTHERS.name]}\n")
+    print(f"Known Extensions: {result.known_extensions}\n")
+    if args.dedupe:
+        action = 'linked' if args.dedupe == 'link' else 'left in place'
+        print(f"Duplicates {action}: {result.duplicates} ({result.duplicate_bytes} bytes)\n")
+    if args.incremental:
+        print(f"Unchanged since the last run: {result.unchanged_folders} folders, {result.unchanged_files} files\n")
+    print("Time: " + ", ".join(f"{name} {seconds:.3f} s" for name, seconds in result.timings.items()) + "\n")
+    if args.dry_run:
+        print(" Nothing was changed, this was a dry run")
+        return
 
     print(" Files are sorted \N{thumbs up sign}")
     print(" You can delete the folder \N{winking face}")
@@ -0,0 +1,220 @@
+"""Binary address book format
+
+    header   magic, format version, flags, record count, offset of the offset table,
+             journal generation (since version 2, see journal.py),
+             offset of the name index (since version 3)
+    records  each one is a u32 payload length followed by the payload:
+             u32 name length + name, u16 birthday length + birthday (0 - no birthday),
+             u32 phones count + (u8 length + phone) for every phone; strings are utf-8.
+             Before version 4 the name length was a u16 and the birthday length and
+             the phones count were u8, too small for some books held in memory
+    table    u64 offset of every record, in the order they were written
+    index    u64 offset of every record, sorted by the casefolded name; records
+             whose names differ only by case keep the order they were written in
+
+Records are written and read one at a time, so neither side holds the whole book
+as an intermediate list. Everything in the file was validated before it was saved,
+so readers may build records without running the field validators again.
+
+Snapshot memory-maps a file and finds records by name with a binary search of
+the index, so a lookup reads a few pages of the file instead of all of it.
+"""
+import mmap
+import struct
+from array import array
+
+from atomic import save_atomically
+
+MAGIC = b'ABOOK'
+VERSION = 4
+
+PREFIX = struct.Struct('<5sH')
+HEADERS = {
+    1: struct.Struct('<5sHHQQ'),
+    2: struct.Struct('<5sHHQQI'),
+    3: struct.Struct('<5sHHQQIQ'),
+    4: struct.Struct('<5sHHQQIQ'),
+}
+HEADER = HEADERS[VERSION]
+LENGTH = struct.Struct('<I')
+# name length, birthday length, phones count and phone length of a record
+FIELDS = tuple(struct.Struct(code) for code in ('<I', '<H', '<I', '<B'))
+LEGACY_FIELDS = tuple(struct.Struct(code) for code in ('<H', '<B', '<B', '<B'))
+
+
+def record_fields(version):
+    return FIELDS if version >= 4 else LEGACY_FIELDS
+
+
+class FormatError(ValueError):
+    pass
+
+
+def is_binary(file):
+    """check the magic of an open file, leaving its position unchanged"""
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return magic == MAGIC
+
+
+def encode_record(data):
+    name_length, birthday_length, count, phone_length = FIELDS
+    name = data['name'].encode()
+    birthday = (data['birthday'] or '').encode()
+    phones = [phone.encode() for phone in data['phones']]
+    parts = [name_length.pack(len(name)), name, birthday_length.pack(len(birthday)), birthday,
+             count.pack(len(phones))]
+    for phone in phones:
+        parts.append(phone_length.pack(len(phone)))
+        parts.append(phone)
+    return b''.join(parts)
+
+
+def pack_record(data):
+    payload = encode_record(data)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def unpack_record(payload, version=VERSION):
+    """the dict encode_record encoded, in the record layout of the format version"""
+    name_length, birthday_length, count, phone_length = record_fields(version)
+    length, = name_length.unpack_from(payload)
+    position = name_length.size + length
+    name = payload[name_length.size:position].decode()
+    length, = birthday_length.unpack_from(payload, position)
+    position += birthday_length.size
+    birthday = payload[position:position + length].decode() or None
+    position += length
+    phones_count, = count.unpack_from(payload, position)
+    position += count.size
+    phones = []
+    for _ in range(phones_count):
+        length, = phone_length.unpack_from(payload, position)
+        position += phone_length.size
+        phones.append(payload[position:position + length].decode())
+        position += length
+    return {'name': name, 'phones': phones, 'birthday': birthday}
+
+
+def write_records(file, records, generation=0):
+    """write an iterable of Record.to_dict() dicts, return how many were written"""
+    file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, generation, 0))
+    offsets = array('Q')
+    folded = []
+    position = HEADER.size
+    for data in records:
+        chunk = pack_record(data)
+        offsets.append(position)
+        folded.append(data['name'].casefold())
+        file.write(chunk)
+        position += len(chunk)
+    file.write(offsets.tobytes())
+    # sorted() is stable, equal names stay in the order they were written
+    order = sorted(range(len(folded)), key=folded.__getitem__)
+    del folded
+    file.write(array('Q', [offsets[i] for i in order]).tobytes())
+    file.seek(0)
+    file.write(HEADER.pack(MAGIC, VERSION, 0, len(offsets), position, generation,
+                           position + len(offsets) * offsets.itemsize))
+    file.seek(0, 2)
+    return len(offsets)
+
+
+def read_header(file):
+    """(version, flags, count, table_offset, generation, index_offset) of an open file,
+    generation and index_offset are 0 in versions that do not have them"""
+    prefix = file.read(PREFIX.size)
+    if len(prefix) != PREFIX.size:
+        raise FormatError('Truncated address book header')
+    magic, version = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise FormatError('Not an address book file')
+    if version not in HEADERS:
+        raise FormatError(f'Unsupported address book format version {version}')
+    header = HEADERS[version]
+    rest = file.read(header.size - PREFIX.size)
+    if len(rest) != header.size - PREFIX.size:
+        raise FormatError('Truncated address book header')
+    magic, version, flags, count, table_offset, *rest = header.unpack(prefix + rest)
+    generation, index_offset = (rest + [0, 0])[:2]
+    return version, flags, count, table_offset, generation, index_offset
+
+
+def read_records(file, header=None):
+    """stream Record.to_dict()-shaped dicts from an open file, header is the result of
+    read_header when the caller has already read it"""
+    version, flags, count, *_ = header or read_header(file)
+    for _ in range(count):
+        length = file.read(LENGTH.size)
+        if len(length) != LENGTH.size:
+            raise FormatError('Truncated address book record')
+        payload = file.read(LENGTH.unpack(length)[0])
+        yield unpack_record(payload, version)
+
+
+def read_offsets(file):
+    """offsets of all records, for random access with read_record_at"""
+    version, flags, count, table_offset, generation, index_offset = read_header(file)
+    file.seek(table_offset)
+    offsets = array('Q')
+    offsets.frombytes(file.read(count * offsets.itemsize))
+    return offsets
+
+
+def read_record_at(file, offset, version=VERSION):
+    file.seek(offset)
+    length, = LENGTH.unpack(file.read(LENGTH.size))
+    return unpack_record(file.read(length), version)
+
+
+class Snapshot:
+    """a saved book opened for reading records by name without loading the others"""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as file:
+            self.version, flags, self.count, table_offset, self.generation, index_offset = read_header(file)
+            if not index_offset:
+                raise FormatError('The address book has no name index, it was saved by an older version')
+            # the map keeps the file open on its own
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = memoryview(self.map)[index_offset:index_offset + self.count * 8].cast('Q')
+
+    def name_at(self, offset):
+        name_length = record_fields(self.version)[0]
+        length, = name_length.unpack_from(self.map, offset + LENGTH.size)
+        start = offset + LENGTH.size + name_length.size
+        return self.map[start:start + length].decode()
+
+    def record_at(self, offset):
+        length, = LENGTH.unpack_from(self.map, offset)
+        return unpack_record(self.map[offset + LENGTH.size:offset + LENGTH.size + length], self.version)
+
+    def find(self, folded):
+        """records whose casefolded name is folded, in the order they were written"""
+        index, low, high = self.index, 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.name_at(index[middle]).casefold() < folded:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count and self.name_at(index[low]).casefold() == folded:
+            found.append(self.record_at(index[low]))
+            low += 1
+        return found
+
+    def records(self):
+        """every record in the order they were written"""
+        position = HEADERS[self.version].size
+        for _ in range(self.count):
+            length, = LENGTH.unpack_from(self.map, position)
+            position += LENGTH.size
+            yield unpack_record(self.map[position:position + length], self.version)
+            position += length
+
+    def close(self):
+        # the map cannot be closed while the index still points into it
+        self.index.release()
+        self.map.close()
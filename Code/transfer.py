@@ -0,0 +1,138 @@
+"""Bulk import and export of contacts as CSV or JSON Lines
+
+Rows are read lazily and handled in chunks: every chunk is validated column
+by column with validators.validate_many and merged into the book through
+AddressBook.add_records, so memory use does not depend on the file size.
+
+CSV files have a header with name, phones and birthday columns, phones are
+separated by ';'. JSON Lines files hold one Record.to_dict() object per line;
+a line that is not one is rejected with its line number, like an invalid row.
+"""
+import csv
+import json
+import time
+from itertools import islice
+
+from classes import Record
+from validators import validate_many
+
+CHUNK_SIZE = 10_000
+FIELDS = ('name', 'phones', 'birthday')
+PHONE_SEPARATOR = ';'
+MAX_REPORTED_ERRORS = 10
+
+
+def file_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'json', 'ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Unknown file format of {filename}, use .csv or .jsonl")
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        phones = (row.get('phones') or '').split(PHONE_SEPARATOR)
+        yield {
+            'name': (row.get('name') or '').strip(),
+            'phones': [phone.strip() for phone in phones if phone.strip()],
+            'birthday': (row.get('birthday') or '').strip() or None,
+        }
+
+
+def unreadable(message):
+    """a row build_records rejects with message"""
+    return {'name': '', 'phones': [], 'birthday': None, 'error': message}
+
+
+def read_jsonl(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield unreadable(f'line {number}: not valid JSON: {e}')
+            continue
+        if not isinstance(data, dict):
+            yield unreadable(f'line {number}: not a JSON object')
+            continue
+        phones = data.get('phones') or []
+        if isinstance(phones, str):
+            phones = [phones]
+        if not isinstance(phones, list):
+            yield unreadable(f'line {number}: phones must be a list')
+            continue
+        yield {
+            'name': data.get('name') or '',
+            'phones': phones,
+            'birthday': data.get('birthday') or None,
+        }
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def build_records(rows):
+    """validate a chunk of rows, return (records, [(row index, message)]) - a row
+    with any invalid field is left out"""
+    names = [row['name'] for row in rows]
+    phones, owners = [], []
+    for index, row in enumerate(rows):
+        phones.extend(row['phones'])
+        owners.extend([index] * len(row['phones']))
+    errors, _ = validate_many(names=names, phones=phones, birthdays=[row['birthday'] for row in rows])
+
+    # rows the reader could not make sense of come with their own message
+    rejected = {index: row['error'] for index, row in enumerate(rows) if 'error' in row}
+    for column, index, message in errors:
+        row = owners[index] if column == 'phone' else index
+        rejected.setdefault(row, f'{column}: {message}')
+    records = [Record.from_dict(row, validate=False) for index, row in enumerate(rows) if index not in rejected]
+    return records, sorted(rejected.items())
+
+
+def import_contacts(book, filename, chunk_size=CHUNK_SIZE):
+    """merge the contacts of a CSV or JSON Lines file into book, return a report dict"""
+    reader = read_csv if file_format(filename) == 'csv' else read_jsonl
+    report = {'rows': 0, 'added': 0, 'merged': 0, 'rejected': 0, 'errors': []}
+    start = time.perf_counter()
+    with open(filename, newline='', encoding='utf-8') as file:
+        for chunk in chunked(reader(file), chunk_size):
+            records, errors = build_records(chunk)
+            added, merged = book.add_records(records)
+            for index, message in errors[:MAX_REPORTED_ERRORS - len(report['errors'])]:
+                report['errors'].append(f'row {report["rows"] + index + 1}: {message}')
+            report['rows'] += len(chunk)
+            report['added'] += added
+            report['merged'] += merged
+            report['rejected'] += len(errors)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+def write_csv(file, records):
+    writer = csv.writer(file)
+    writer.writerow(FIELDS)
+    for record in records:
+        data = record.to_dict()
+        writer.writerow((data['name'], PHONE_SEPARATOR.join(data['phones']), data['birthday'] or ''))
+
+
+def write_jsonl(file, records):
+    for record in records:
+        file.write(json.dumps(record.to_dict(), ensure_ascii=False))
+        file.write('\n')
+
+
+def export_contacts(book, filename):
+    """write every contact of book to a CSV or JSON Lines file, return a report dict"""
+    writer = write_csv if file_format(filename) == 'csv' else write_jsonl
+    start = time.perf_counter()
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer(file, book.values())
+    return {'rows': len(book), 'seconds': time.perf_counter() - start}
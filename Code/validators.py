@@ -0,0 +1,93 @@
+"""Validation of contact fields, shared by the field classes and bulk loading
+
+Patterns are compiled once, on first use, so importing this module does not
+pay for re. validate_many checks whole columns: a column is joined into one
+string and matched by a single regex call, values are only looked at one by
+one when that match fails, to report which of them are invalid. Birthdays are
+parsed into datetime.date once and cached, so the same date string is never
+parsed twice.
+"""
+from functools import lru_cache
+
+NAME_CHARS = 'a-zA-Z0-9а-яА-Я\\s'
+SEPARATOR = '\x00'  # never valid in a name or a phone
+
+NAME_PATTERN = f'[{NAME_CHARS}]+'
+PHONE_PATTERN = '[0-9]{10}'
+BIRTHDAY_PATTERN = r'([0-9]{1,2})([-/ .])([0-9]{1,2})\2([0-9]{4})'
+
+NAME_COLUMN = f'(?:[{NAME_CHARS}]+{SEPARATOR})*[{NAME_CHARS}]+'
+PHONE_COLUMN = f'(?:[0-9]{{10}}{SEPARATOR})*[0-9]{{10}}'
+
+BIRTHDAY_FORMAT_ERROR = 'Incorrect date format. Must be in dd-mm-yyyy, dd/mm/yyyy, dd mm yyyy, or dd.mm.yyyy'
+
+
+@lru_cache(maxsize=None)
+def compiled(pattern):
+    import re
+    return re.compile(pattern)
+
+
+def validate_name(value):
+    if not compiled(NAME_PATTERN).fullmatch(value):
+        raise ValueError("Invalid name format")
+    return value
+
+
+def validate_phone(value):
+    if not compiled(PHONE_PATTERN).fullmatch(value):
+        raise ValueError("Phone number must be 10 digits")
+    return value
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_birthday(value):
+    """datetime.date of a birthday in dd-mm-yyyy, dd/mm/yyyy, dd mm yyyy or dd.mm.yyyy"""
+    import datetime
+    match = compiled(BIRTHDAY_PATTERN).fullmatch(value.strip())
+    if not match:
+        raise ValueError(BIRTHDAY_FORMAT_ERROR)
+    day, _, month, year = match.groups()
+    try:
+        if int(year) < 1000:
+            raise ValueError
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}. The date is not correct.') from None
+
+
+def _column_matches(pattern, values):
+    try:
+        joined = SEPARATOR.join(values)
+    except TypeError:
+        return False
+    return joined.count(SEPARATOR) == len(values) - 1 and compiled(pattern).fullmatch(joined) is not None
+
+
+def validate_many(names=(), phones=(), birthdays=()):
+    """validate columns of names, phones and birthdays in one pass
+
+    returns (errors, dates): errors lists (column, index, message) for every invalid
+    value, dates holds the parsed birthdays, None where a birthday is empty or invalid"""
+    errors = []
+    for column, values, pattern, validate in (('name', names, NAME_COLUMN, validate_name),
+                                              ('phone', phones, PHONE_COLUMN, validate_phone)):
+        if not values or _column_matches(pattern, values):
+            continue
+        for index, value in enumerate(values):
+            try:
+                validate(value)
+            except (ValueError, TypeError) as e:
+                errors.append((column, index, str(e)))
+
+    dates = []
+    for index, value in enumerate(birthdays):
+        if not value:
+            dates.append(None)
+            continue
+        try:
+            dates.append(parse_birthday(value))
+        except (ValueError, TypeError, AttributeError) as e:
+            dates.append(None)
+            errors.append(('birthday', index, str(e)))
+    return errors, dates